@@ -39,6 +39,11 @@ class JCompoundMapperCLIDriver():
 
     DISTANCE_MEASURES = ('TANIMOTO', 'MINMAX')
 
+    #File extensions for the outputs we know how to read with mlio
+    OUTPUT_EXTENSIONS = {'WEKA_HASHED': '.arff',          #mlio.load_sparse_arff
+                         'LIBSVM_SPARSE': '.libsvm',      #mlio.load_libsvm
+                         'LIBSVM_MATRIX': '.libsvm-kernel'}  #mlio.load_libsvm_matrix
+
     def __init__(self,
                  java_command='java',
                  jcompoundmapperjar=None):
@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 from numpy import *
-from scipy.linalg import eig
-from kernels import gaussian_kernel, kernel_matrix
+import json
+from multiprocessing.pool import ThreadPool
+from scipy.linalg import eig, eigh
+from scipy.sparse.linalg import eigsh
+from scipy.special import gammaln, logsumexp
+import kernels
+from kernels import gaussian_kernel, kernel_matrix, cross_kernel_matrix, kernel_diagonal, kernel_input, squared_distance
 import prepro
+from mayolmol.mlmusings import mlio, neighbors
 
 def inertia(eigenvalues):
     return[eigenvalue / sum(eigenvalues) for eigenvalue in eigenvalues]
@@ -26,30 +32,109 @@ def pca(x, target_dim=None):
 
     return dot(x, eigenvectors), eigenvectors, eigenvalues, inertias
 
-def center_kernel_matrix(K, mmul=True):
-    #Some algebra can optimize this both in time and space, think...
-    if mmul:
-        num_examples, _ = K.shape
-        onen = ones((num_examples, num_examples)) / num_examples
-        onenK = dot(onen, K)
-        return K - onenK - onenK.T + dot(onenK, onen)
+def _chunks(x, chunk_size):
+    for start in range(0, shape(x)[0], chunk_size):
+        chunk = x[start:start + chunk_size]
+        yield start, chunk.toarray() if hasattr(chunk, 'toarray') else asarray(chunk, dtype=float64)
+
+def _randomized_components(x, target_dim, oversampling=10, power_iterations=2, seed=0, chunk_size=4096):
+    """ Randomized SVD (Halko et al.) of the centered x, which is never formed: x is only read
+        in chunks (so it can be a memmap or a sparse matrix) to compute products with thin matrices.
+        Returns the means, the top variances and directions and the total variance.
+    """
+    num_examples, num_features = shape(x)
+    target_dim = min(target_dim, num_features)
+    sketch_dim = min(target_dim + oversampling, num_features)
+    mean = zeros(num_features)
+    sqsum = zeros(num_features)
+    for _, chunk in _chunks(x, chunk_size):
+        mean += chunk.sum(0)
+        sqsum += (chunk ** 2).sum(0)
+    mean /= num_examples
+    total_variance = (sqsum - num_examples * mean ** 2).sum() / (num_examples - 1)
+
+    def times(right):
+        #(x - mean) right
+        product = empty((num_examples, right.shape[1]))
+        for start, chunk in _chunks(x, chunk_size):
+            product[start:start + len(chunk)] = dot(chunk, right)
+        return product - dot(mean, right)
+
+    def transposed_times(left):
+        #(x - mean)' left
+        product = zeros((num_features, left.shape[1]))
+        for start, chunk in _chunks(x, chunk_size):
+            product += dot(chunk.T, left[start:start + len(chunk)])
+        return product - outer(mean, left.sum(0))
+
+    Q, _ = linalg.qr(times(random.RandomState(seed).normal(size=(num_features, sketch_dim))))
+    for _ in range(power_iterations):
+        Z, _ = linalg.qr(transposed_times(Q))
+        Q, _ = linalg.qr(times(Z))
+    _, singular_values, Vt = linalg.svd(transposed_times(Q).T, full_matrices=False)
+    eigenvalues = singular_values[:target_dim] ** 2 / (num_examples - 1)
+    return mean, eigenvalues, Vt[:target_dim].T, total_variance
+
+def randomized_pca(x, target_dim=2, oversampling=10, power_iterations=2, seed=0, chunk_size=4096):
+    """ Top target_dim PCs of x by randomized SVD, for tall (possibly memory-mapped or sparse)
+        matrices: a few passes over x in chunks, O(n d k) time and no d x d covariance.
+        Unlike pca, the projection is of the centered data.
+        Returns the projection, the eigenvectors, the eigenvalues and the inertias (relative
+        to the total variance).
+    """
+    mean, eigenvalues, eigenvectors, total_variance = \
+        _randomized_components(x, target_dim, oversampling, power_iterations, seed, chunk_size)
+    projection = empty((shape(x)[0], len(eigenvalues)))
+    for start, chunk in _chunks(x, chunk_size):
+        projection[start:start + len(chunk)] = dot(chunk - mean, eigenvectors)
+    return projection, eigenvectors, eigenvalues, list(eigenvalues / total_variance)
+
+def center_kernel_matrix(K, in_place=False):
+    """ K' = K - 1nK - K1n + 1nK1n, that is, removing the column means, the row means
+        and adding back the grand mean; O(n^2) and, if in_place, without any n x n buffer.
+    """
+    if not in_place:
+        K = array(K, dtype=float64)
+    column_means = K.mean(0)
+    row_means = K.mean(1)
+    grand_mean = row_means.mean()
+    K -= column_means[newaxis, :]
+    K -= row_means[:, newaxis]
+    K += grand_mean
+    return K
 
 def shuffle_matrix(matrix, seed=0):
     import random
     ne, _ = matrix.shape
     shuffled = range(ne)
     random.Random(seed).shuffle(shuffled)
-    km01 = zeros([ne, ne])
-    for i in range(ne):
-        for j in range (ne):
-            km01[i,j]=matrix[shuffled[i], shuffled[j]]
-    return km01
+    return matrix[ix_(shuffled, shuffled)]
+
+def top_eigenpairs(K, target_dim, solver='auto'):
+    """ The target_dim largest eigenvalues (descending) and eigenvectors of the symmetric K.
+        solver can be "eigsh" (Lanczos, for few components of big matrices), "eigh" (LAPACK,
+        computing only the wanted subset) or "auto" (eigsh if target_dim < n / 10).
+    """
+    num_examples = K.shape[0]
+    if solver == 'auto':
+        solver = 'eigsh' if target_dim < num_examples / 10 else 'eigh'
+    if solver == 'eigsh':
+        eigenvalues, eigenvectors = eigsh(K, k=target_dim, which='LA')
+    else:
+        eigenvalues, eigenvectors = eigh(K, eigvals=(num_examples - target_dim, num_examples - 1))
+    order = argsort(eigenvalues)[::-1]
+    return eigenvalues[order], eigenvectors[:, order]
 
-def kpca(x, target_dim=None, kernel=gaussian_kernel, shuffle=None, **kernel_params):
+def kpca(x, target_dim=None, kernel=gaussian_kernel, shuffle=None, solver='auto', **kernel_params):
+    """ Kernel PCA. Only the target_dim top components are computed (see top_eigenpairs), and
+        the inertias are relative to the trace of the centered kernel (the sum of all eigenvalues).
+        The kernel matrix is centered in place, so the returned K is the centered one.
+    """
     #Recall that in kpca, depending on the kernel, each point can span a new direction in feature space...
     num_examples, num_features = shape(x)
     if not target_dim:
         target_dim = num_features #...we usually do not want that many
+    target_dim = min(target_dim, num_examples)
 
     #Compute the kernel matrix
     K = kernel_matrix(x, kernel=kernel, **kernel_params)
@@ -57,15 +142,359 @@ def kpca(x, target_dim=None, kernel=gaussian_kernel, shuffle=None, **kernel_para
         K = shuffle_matrix(K, shuffle)
 
     #Center the data in feature space: K' = K -1nK -K1n +1nK1n
-    K = center_kernel_matrix(K)
-
-    #Eigendecomposition
-    eigenvalues, eigenvectors = eig(K)
+    K = center_kernel_matrix(K, in_place=True)
 
-    #Selection of the PCs
-    eigenvalues, eigenvectors, inertias = select_top(eigenvalues, eigenvectors, target_dim)
+    #Eigendecomposition, just of the PCs we want
+    eigenvalues, eigenvectors = top_eigenpairs(K, target_dim, solver)
+    inertias = list(eigenvalues / trace(K))
 
     #Transform
-    x = dot(diag(sqrt(eigenvalues)), eigenvectors.T).T
+    x = eigenvectors * sqrt(maximum(eigenvalues, 0))
+
+    return x, K, eigenvectors, eigenvalues, inertias
+
+def kmeanspp_landmarks(x, num_landmarks, kernel=gaussian_kernel, seed=0, chunk_size=4096, **kernel_params):
+    """ Indices of num_landmarks rows of x chosen by k-means++ seeding in the feature space of
+        the kernel: each new landmark is drawn with probability proportional to its squared
+        distance k(a, a) + k(b, b) - 2k(a, b) to the closest landmark so far.
+        x is converted to the kernel input chunk by chunk, so sparse x is never densified whole.
+    """
+    rng = random.RandomState(seed)
+    diagonal = kernel_diagonal(x, kernel, **kernel_params)
+    landmarks = [rng.randint(shape(x)[0])]
+    closest = inf
+    for _ in range(1, num_landmarks):
+        last = landmarks[-1]
+        last_x = kernel_input(x[last:last + 1], kernel)
+        k = concatenate([cross_kernel_matrix(x[start:start + chunk_size], last_x, kernel, **kernel_params)[:, 0]
+                         for start in range(0, shape(x)[0], chunk_size)])
+        closest = minimum(closest, maximum(diagonal + diagonal[last] - 2 * k, 0))
+        if not closest.sum():
+            break #Less than num_landmarks different points
+        landmarks.append(rng.choice(len(closest), p=closest / closest.sum()))
+    return array(landmarks)
+
+def _nystrom_features(x, landmarks_x, W_isqrt, kernel, chunk_size, **kernel_params):
+    """ Yields the chunks of the Nystrom feature map K(x, landmarks) W^-1/2 """
+    for start in range(0, shape(x)[0], chunk_size):
+        C = cross_kernel_matrix(x[start:start + chunk_size], landmarks_x, kernel, **kernel_params)
+        yield start, dot(C, W_isqrt)
+
+def _fit_nystrom(x, target_dim, num_landmarks, landmarks, kernel, seed, chunk_size, **kernel_params):
+    """ The first pass of nystrom_kpca: landmarks, W^-1/2, feature means and top eigenpairs """
+    num_examples = shape(x)[0]
+    num_landmarks = min(num_landmarks, num_examples)
+    if isinstance(landmarks, basestring):
+        if landmarks == 'kmeans++':
+            landmarks = kmeanspp_landmarks(x, num_landmarks, kernel, seed, chunk_size, **kernel_params)
+        else:
+            landmarks = random.RandomState(seed).permutation(num_examples)[:num_landmarks]
+    landmarks = sort(landmarks)
+    landmarks_x = kernel_input(x[landmarks], kernel)
+
+    #W^-1/2, as a pseudo-inverse for rank deficient W
+    w_values, w_vectors = eigh(kernel_matrix(landmarks_x, kernel=kernel, **kernel_params))
+    keep = w_values > w_values.max() * 1e-10
+    W_isqrt = w_vectors[:, keep] / sqrt(w_values[keep])
+
+    #Mean and covariance of the features
+    feature_sum = zeros(W_isqrt.shape[1])
+    scatter = zeros((W_isqrt.shape[1], W_isqrt.shape[1]))
+    for _, F in _nystrom_features(x, landmarks_x, W_isqrt, kernel, chunk_size, **kernel_params):
+        feature_sum += F.sum(0)
+        scatter += dot(F.T, F)
+    mean = feature_sum / num_examples
+    scatter -= num_examples * outer(mean, mean)
+
+    #The eigenvalues of the centered approximated K are those of the scatter
+    eigenvalues, eigenvectors = top_eigenpairs(scatter, min(target_dim, len(scatter)), 'eigh')
+    inertias = list(eigenvalues / trace(scatter))
+    return landmarks, landmarks_x, W_isqrt, mean, eigenvalues, eigenvectors, inertias
+
+def nystrom_kpca(x, target_dim=2, num_landmarks=500, landmarks='uniform', kernel=gaussian_kernel,
+                 seed=0, chunk_size=4096, **kernel_params):
+    """ Kernel PCA on the Nystrom approximation K ~ C W^+ C' of the kernel matrix, where W is the
+        kernel among num_landmarks landmarks (drawn "uniform"ly or by "kmeans++", or given as indices)
+        and C the kernel between all the examples and the landmarks.
+        K ~ F F' with F = C W^-1/2, so this is just (centered) PCA of the n x m features F, done in
+        two passes over x in chunks (covariance, projection): O(n m^2) time and O(m^2) memory
+        besides the result, instead of the n x n kernel.
+        The kernel is assumed positive semidefinite: the non-positive eigenvalues of W are dropped.
+        Only the landmarks and one chunk at a time are converted to the kernel input, so sparse
+        fingerprints are never densified whole.
+        Returns the embedding, the landmark indices, the eigenvalues and the inertias.
+    """
+    landmarks, landmarks_x, W_isqrt, mean, eigenvalues, eigenvectors, inertias = \
+        _fit_nystrom(x, target_dim, num_landmarks, landmarks, kernel, seed, chunk_size, **kernel_params)
+    embedding = empty((shape(x)[0], len(eigenvalues)))
+    for start, F in _nystrom_features(x, landmarks_x, W_isqrt, kernel, chunk_size, **kernel_params):
+        embedding[start:start + len(F)] = dot(F - mean, eigenvectors)
+    return embedding, landmarks, eigenvalues, inertias
+
+def nystrom_report(x, target_dim=2, num_landmarks=500, landmarks='uniform', kernel=gaussian_kernel,
+                   sample_size=2000, seed=0, **kernel_params):
+    """ Compares nystrom_kpca with exact kpca on a random sample of sample_size examples.
+        Returns a dict with:
+          - kernel_error: relative Frobenius error of the approximated (centered) kernel matrix
+          - eigenvalues: the exact and the approximated top target_dim eigenvalues
+          - alignment: cosines between the exact and approximated components (1 is perfect)
+    """
+    sample = sort(random.RandomState(seed).permutation(shape(x)[0])[:sample_size])
+    x = kernel_input(x[sample], kernel)
+    exact, K, _, exact_values, _ = kpca(x, target_dim, kernel=kernel, **kernel_params)
+    approx, _, approx_values, _ = nystrom_kpca(x, target_dim, num_landmarks, landmarks, kernel,
+                                               seed=seed, **kernel_params)
+    #The approximated centered kernel is the embedding in all the components
+    full, _, _, _ = nystrom_kpca(x, num_landmarks, num_landmarks, landmarks, kernel, seed=seed, **kernel_params)
+    kernel_error = linalg.norm(K - dot(full, full.T)) / linalg.norm(K)
+    norms = sqrt((exact ** 2).sum(0) * (approx ** 2).sum(0))
+    alignment = abs((exact * approx).sum(0)) / maximum(norms, 1e-300)
+    return {'kernel_error': kernel_error,
+            'eigenvalues': (exact_values, approx_values),
+            'alignment': alignment}
+
+def _gaussian_log_normalizer(num_features, sigma):
+    """ log of the integral of gaussian_kernel, exp(-r^4 / (2 sigma^2)), over R^num_features """
+    half, quarter = num_features / 2.0, num_features / 4.0
+    return log(2) + half * log(pi) - gammaln(half) + quarter * log(2 * sigma ** 2) + gammaln(quarter) - log(4)
+
+def bandwidth_sweep(x, sigmas, criterion='inertia', target_dim=2, y=None, k=5, threads=1,
+                    dtype=float32, tile_size=1024):
+    """ Evaluates gaussian_kernel kpca for each sigma in sigmas computing the distances only once:
+        the squared distances matrix is computed (in tiles, as dtype) and each candidate kernel is
+        derived from it with an in-place elementwise exp. The criterion can be:
+          - "inertia": fraction of the variance captured by the target_dim top components
+          - "knn": leave-one-out kNN accuracy (k neighbors, labels y) in the kpca embedding
+          - "loglikelihood": leave-one-out log-likelihood of the data under the kernel density
+            estimate (no kpca needed)
+        Candidates can be evaluated by a pool of threads (numpy releases the GIL in the heavy
+        parts), at the price of one n x n buffer per thread.
+        Returns the best sigma and the scores of all of them (higher is better).
+    """
+    if criterion == 'knn' and y is None:
+        raise Exception('The knn criterion needs the labels y')
+    num_examples, num_features = shape(x)
+    #gaussian_kernel uses the squared squared distance, so that is what we keep
+    D4 = kernel_matrix(x, squared_distance, tile_size=tile_size, dtype=dtype)
+    D4 **= 2
+
+    def evaluate(sigma):
+        exponents = multiply(D4, -1.0 / (2 * sigma ** 2), dtype=dtype)
+        if criterion == 'loglikelihood':
+            fill_diagonal(exponents, -inf)
+            log_densities = logsumexp(exponents, axis=1) - log(num_examples - 1)
+            return float(log_densities.mean() - _gaussian_log_normalizer(num_features, sigma))
+        K = center_kernel_matrix(exp(exponents, out=exponents), in_place=True)
+        eigenvalues, eigenvectors = top_eigenpairs(K, min(target_dim, num_examples - 1))
+        if criterion == 'inertia':
+            return float(eigenvalues.sum() / trace(K))
+        embedding = eigenvectors * sqrt(maximum(eigenvalues, 0))
+        return 1.0 - neighbors.knn_graph(embedding, k).error(y)
+
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            scores = pool.map(evaluate, sigmas)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        scores = map(evaluate, sigmas)
+    return sigmas[argmax(scores)], scores
+
+class PCA(object):
+    """ PCA as a model: fit on some data, transform any other, save / load to a .npz file.
+        Unlike pca, the data is centered on the training means before projecting.
+        solver can be "eigh" (of the covariance matrix) or "randomized" (see randomized_pca).
+    """
+    def __init__(self, target_dim=None, solver='eigh', seed=0):
+        self.target_dim = target_dim
+        self.solver = solver
+        self.seed = seed
+
+    def fit(self, x):
+        target_dim = min(self.target_dim or shape(x)[1], shape(x)[1])
+        if self.solver == 'randomized':
+            self.mean, self.eigenvalues, self.eigenvectors, total_variance = \
+                _randomized_components(x, target_dim, seed=self.seed)
+            self.inertias = list(self.eigenvalues / total_variance)
+            return self
+        x = asarray(x, dtype=float64)
+        self.mean = x.mean(0)
+        covariance = atleast_2d(cov(x.T))
+        self.eigenvalues, self.eigenvectors = top_eigenpairs(covariance, target_dim, 'eigh')
+        self.inertias = list(self.eigenvalues / trace(covariance))
+        return self
+
+    def transform(self, x):
+        if hasattr(x, 'toarray'):
+            x = x.toarray()
+        return dot(asarray(x, dtype=float64) - self.mean, self.eigenvectors)
+
+    def fit_transform(self, x):
+        return self.fit(x).transform(x)
+
+    def save(self, dest):
+        savez(dest, kind='pca', mean=self.mean, eigenvalues=self.eigenvalues,
+              eigenvectors=self.eigenvectors, inertias=self.inertias)
+
+    @staticmethod
+    def load(src):
+        return load_model(src)
+
+class KernelPCA(object):
+    """ kpca (or nystrom_kpca, if num_landmarks is given) as a model: fit on some data, project
+        new examples with transform and save / load it to a .npz file.
+        The model keeps the training examples (or the landmarks) and the kernel centering terms,
+        so transforming n_new examples costs n_new x n_train (or n_new x landmarks) kernel evaluations.
+        Only the kernels in mlmusings.kernels can be saved.
+    """
+    def __init__(self, target_dim=2, kernel=gaussian_kernel, num_landmarks=None, landmarks='uniform',
+                 solver='auto', seed=0, chunk_size=4096, **kernel_params):
+        self.target_dim = target_dim
+        self.kernel = kernel
+        self.num_landmarks = num_landmarks
+        self.landmarks = landmarks
+        self.solver = solver
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.kernel_params = kernel_params
+
+    def fit(self, x):
+        if self.num_landmarks:
+            _, self.train_x, W_isqrt, mean, self.eigenvalues, eigenvectors, self.inertias = \
+                _fit_nystrom(x, self.target_dim, self.num_landmarks, self.landmarks, self.kernel,
+                             self.seed, self.chunk_size, **self.kernel_params)
+            #transform: (C W^-1/2 - mean) V = C alphas - offset
+            self.alphas = dot(W_isqrt, eigenvectors)
+            self.offset = dot(mean, eigenvectors)
+            self.column_means = self.grand_mean = None
+        else:
+            self.train_x = x = kernel_input(x, self.kernel)
+            K = kernel_matrix(x, kernel=self.kernel, **self.kernel_params)
+            self.column_means = K.mean(0)
+            self.grand_mean = self.column_means.mean()
+            K = center_kernel_matrix(K, in_place=True)
+            self.eigenvalues, eigenvectors = top_eigenpairs(K, min(self.target_dim, len(K)), self.solver)
+            self.inertias = list(self.eigenvalues / trace(K))
+            #A training example projects to sqrt(eigenvalue) v = K' v / sqrt(eigenvalue)
+            self.alphas = eigenvectors / sqrt(maximum(self.eigenvalues, 1e-300))
+            self.offset = None
+        return self
+
+    def transform(self, x):
+        #cross_kernel_matrix converts each chunk to the kernel input
+        embedding = empty((shape(x)[0], self.alphas.shape[1]))
+        for start in range(0, shape(x)[0], self.chunk_size):
+            K = cross_kernel_matrix(x[start:start + self.chunk_size], self.train_x, self.kernel, **self.kernel_params)
+            if self.offset is None:
+                #Center the new rows with the training statistics
+                K -= K.mean(1)[:, newaxis]
+                K -= self.column_means[newaxis, :]
+                K += self.grand_mean
+                embedding[start:start + len(K)] = dot(K, self.alphas)
+            else:
+                embedding[start:start + len(K)] = dot(K, self.alphas) - self.offset
+        return embedding
+
+    def fit_transform(self, x):
+        return self.fit(x).transform(x)
+
+    def save(self, dest):
+        if getattr(kernels, self.kernel.__name__, None) is not self.kernel:
+            raise Exception('Only the kernels in mlmusings.kernels can be saved, not %s' % self.kernel.__name__)
+        arrays = {'kind': 'kpca', 'kernel': self.kernel.__name__, 'kernel_params': json.dumps(self.kernel_params),
+                  'train_x': self.train_x, 'alphas': self.alphas, 'eigenvalues': self.eigenvalues,
+                  'inertias': self.inertias, 'chunk_size': self.chunk_size}
+        for name in ('column_means', 'grand_mean', 'offset'):
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+        savez(dest, **arrays)
+
+    @staticmethod
+    def load(src):
+        return load_model(src)
+
+class IncrementalPCA(PCA):
+    """ PCA fed with blocks of examples (e.g. from mlio.iter_arff), for datasets that do not fit
+        in memory: only the means and the d x d scatter matrix are kept, merged block by block
+        with the pairwise update of Chan et al. (numerically safer than summing squares).
+        Call partial_fit for each block (or fit with an iterable of blocks, or fit_arff) and
+        then transform, save... as with PCA. The eigendecomposition is only redone when needed,
+        not after every block.
+    """
+    def __init__(self, target_dim=None):
+        PCA.__init__(self, target_dim)
+        self.num_examples = 0
+        self.mean = None
+        self.scatter = None
+        self._solved = False
+
+    def partial_fit(self, x):
+        if hasattr(x, 'toarray'):
+            x = x.toarray()
+        x = asarray(x, dtype=float64)
+        if not len(x):
+            return self
+        block_mean = x.mean(0)
+        centered = x - block_mean
+        block_scatter = dot(centered.T, centered)
+        if not self.num_examples:
+            self.mean, self.scatter = block_mean, block_scatter
+        else:
+            total = self.num_examples + len(x)
+            delta = block_mean - self.mean
+            self.scatter += block_scatter + outer(delta, delta) * self.num_examples * len(x) / float(total)
+            self.mean = self.mean + delta * len(x) / float(total)
+        self.num_examples += len(x)
+        self._solved = False
+        return self
+
+    def _solve(self):
+        self._solved = True
+        covariance = self.scatter / max(self.num_examples - 1, 1)
+        target_dim = min(self.target_dim or len(covariance), len(covariance))
+        self.eigenvalues, self.eigenvectors = top_eigenpairs(covariance, target_dim, 'eigh')
+        self.inertias = list(self.eigenvalues / trace(covariance))
+
+    def fit(self, blocks):
+        """ blocks is an iterable of example blocks, or of (x, y) pairs like the ones of mlio.iter_arff """
+        for block in blocks:
+            self.partial_fit(block[0] if isinstance(block, tuple) else block)
+        self._solve()
+        return self
+
+    def fit_arff(self, src, chunk_size=4096):
+        #The classes are ignored; only nominal ones can (and must) be renamed, REAL ones are kept
+        rename_classes = bool(mlio.read_arff_header(src)[2])
+        return self.fit(mlio.iter_arff(src, chunk_size, rename_classes=rename_classes))
+
+    def transform(self, x):
+        if not self._solved:
+            self._solve()
+        return PCA.transform(self, x)
+
+    def save(self, dest):
+        if not self._solved:
+            self._solve()
+        PCA.save(self, dest)
 
-    return x, K, eigenvectors, eigenvalues, inertias
\ No newline at end of file
+def load_model(src):
+    """ Loads a PCA or KernelPCA saved with its save method. """
+    saved = load(src)
+    if str(saved['kind']) == 'pca':
+        model = PCA(len(saved['eigenvalues']))
+        for name in ('mean', 'eigenvalues', 'eigenvectors'):
+            setattr(model, name, saved[name])
+        model.inertias = list(saved['inertias'])
+        return model
+    kernel_params = dict((str(name), value) for name, value in json.loads(str(saved['kernel_params'])).items())
+    model = KernelPCA(len(saved['eigenvalues']), getattr(kernels, str(saved['kernel'])),
+                      chunk_size=int(saved['chunk_size']), **kernel_params)
+    for name in ('train_x', 'alphas', 'eigenvalues'):
+        setattr(model, name, saved[name])
+    model.inertias = list(saved['inertias'])
+    model.column_means = saved['column_means'] if 'column_means' in saved.files else None
+    model.grand_mean = float(saved['grand_mean']) if 'grand_mean' in saved.files else None
+    model.offset = saved['offset'] if 'offset' in saved.files else None
+    return model
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+import unittest
+import os.path as op
+import shutil
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+from scipy.linalg import eig
+from mayolmol.mlmusings import dr, kernels, mlio
+
+class KPCATest(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.random.RandomState(0).normal(size=(120, 6))
+
+    def test_center_kernel_matrix(self):
+        K = kernels.kernel_matrix(self.x, sigma=3.0)
+        onen = np.ones(K.shape) / len(K)
+        expected = K - np.dot(onen, K) - np.dot(K, onen) + np.dot(np.dot(onen, K), onen)
+        np.testing.assert_array_almost_equal(expected, dr.center_kernel_matrix(K))
+        centered = dr.center_kernel_matrix(K, in_place=True)
+        self.assertTrue(centered is K)
+        np.testing.assert_array_almost_equal(expected, K)
+
+    def test_shuffle_matrix(self):
+        m = np.arange(16.0).reshape(4, 4)
+        shuffled = dr.shuffle_matrix(m, 3)
+        self.assertEqual(sorted(m[0]), sorted(shuffled[np.argmin(shuffled[:, 0])]))
+        self.assertEqual(m.trace(), shuffled.trace())
+
+    def test_kpca(self):
+        K = dr.center_kernel_matrix(kernels.kernel_matrix(self.x, sigma=3.0))
+        eigenvalues, eigenvectors = eig(K)
+        order = np.argsort(eigenvalues.real)[::-1][:3]
+        for solver in ('eigh', 'eigsh'):
+            x, _, vectors, values, inertias = dr.kpca(self.x, 3, sigma=3.0, solver=solver)
+            np.testing.assert_array_almost_equal(eigenvalues.real[order], values)
+            np.testing.assert_array_almost_equal(eigenvalues.real[order] / eigenvalues.real.sum(), inertias)
+            #Eigenvectors are defined up to the sign
+            np.testing.assert_array_almost_equal(np.abs(eigenvectors.real[:, order]), np.abs(vectors))
+            np.testing.assert_array_almost_equal(np.abs(vectors * np.sqrt(values)), np.abs(x))
+
+    def test_nystrom_kpca(self):
+        #A degree 2 polynomial kernel on 6 features has rank 28, so 40 landmarks are enough
+        poly = {'kernel': kernels.polynomial_kernel, 'degree': 2}
+        exact, _, _, values, _ = dr.kpca(self.x, 2, **poly)
+        x, landmarks, approx_values, inertias = dr.nystrom_kpca(self.x, 2, 40, chunk_size=50, **poly)
+        self.assertEqual(40, len(set(landmarks)))
+        np.testing.assert_array_almost_equal(values, approx_values)
+        np.testing.assert_array_almost_equal(np.abs(exact), np.abs(x))
+        x, landmarks, _, _ = dr.nystrom_kpca(self.x, 2, 30, landmarks='kmeans++', sigma=3.0)
+        self.assertEqual((120, 2), x.shape)
+        self.assertEqual(30, len(set(landmarks)))
+        #Sparse input is converted chunk by chunk, with the same results
+        sparse, sparse_landmarks, _, _ = dr.nystrom_kpca(sp.csr_matrix(self.x), 2, 30, landmarks='kmeans++',
+                                                         chunk_size=50, sigma=3.0)
+        np.testing.assert_array_equal(landmarks, sparse_landmarks)
+        np.testing.assert_array_almost_equal(x, sparse)
+
+    def test_nystrom_report(self):
+        report = dr.nystrom_report(self.x, 2, 40, sample_size=100, kernel=kernels.polynomial_kernel, degree=2)
+        self.assertAlmostEqual(0, report['kernel_error'])
+        np.testing.assert_array_almost_equal([1, 1], report['alignment'])
+        report = dr.nystrom_report(self.x, 2, 10, sample_size=100, kernel=kernels.polynomial_kernel, degree=2)
+        self.assertTrue(report['kernel_error'] > 0.01)
+
+    def test_bandwidth_sweep(self):
+        sigmas = [2.0, 5.0, 20.0]
+        best, scores = dr.bandwidth_sweep(self.x, sigmas, dtype=np.float64)
+        expected = [sum(dr.kpca(self.x, 2, sigma=sigma)[4]) for sigma in sigmas]
+        np.testing.assert_array_almost_equal(expected, scores)
+        self.assertEqual(sigmas[np.argmax(expected)], best)
+        _, threaded = dr.bandwidth_sweep(self.x, sigmas, threads=3)
+        np.testing.assert_array_almost_equal(expected, threaded, decimal=4)
+        y = (self.x[:, 0] > 0).astype(int)
+        _, accuracies = dr.bandwidth_sweep(self.x, sigmas, 'knn', y=y, k=3, dtype=np.float64)
+        for sigma, accuracy in zip(sigmas, accuracies):
+            embedding = dr.kpca(self.x, 2, sigma=sigma)[0]
+            self.assertAlmostEqual(dr.neighbors.nn_acc(dr.neighbors.nns(embedding, 3), y), accuracy)
+        self.assertRaises(Exception, dr.bandwidth_sweep, self.x, sigmas, 'knn')
+
+    def test_bandwidth_loglikelihood(self):
+        #The kernel density integrates to 1, so the likelihood of a 1D sample is a proper one
+        x = np.random.RandomState(0).normal(size=(300, 1))
+        sigmas = [0.01, 0.1, 1.0, 10.0]
+        best, scores = dr.bandwidth_sweep(x, sigmas, 'loglikelihood', dtype=np.float64)
+        grid = np.linspace(-30, 30, 200001)[:, np.newaxis]
+        for sigma in sigmas:
+            density = np.exp(-grid[:, 0] ** 4 / (2 * sigma ** 2)).sum() * (grid[1, 0] - grid[0, 0])
+            self.assertAlmostEqual(np.log(density), dr._gaussian_log_normalizer(1, sigma), places=4)
+        self.assertTrue(0.01 < best < 10.0)
+        self.assertTrue(scores[0] < max(scores))
+
+class ModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.random.RandomState(0).normal(size=(80, 6))
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def check_saved(self, model, new):
+        dest = op.join(self.tmp, 'model.npz')
+        model.save(dest)
+        np.testing.assert_array_almost_equal(model.transform(new), dr.load_model(dest).transform(new))
+
+    def test_pca(self):
+        model = dr.PCA(3)
+        embedding = model.fit_transform(self.x[:60])
+        self.assertEqual((60, 3), embedding.shape)
+        np.testing.assert_array_almost_equal(np.zeros(3), embedding.mean(0))
+        np.testing.assert_array_almost_equal(model.eigenvalues, embedding.var(0, ddof=1))
+        self.check_saved(model, self.x[60:])
+
+    def test_randomized_pca(self):
+        x = np.dot(self.x, np.random.RandomState(1).normal(size=(6, 30))) + 5
+        expected = dr.PCA(3).fit(x)
+        projection, vectors, values, inertias = dr.randomized_pca(x, 3, chunk_size=17)
+        np.testing.assert_array_almost_equal(expected.eigenvalues, values)
+        np.testing.assert_array_almost_equal(expected.inertias, inertias)
+        np.testing.assert_array_almost_equal(np.abs(expected.transform(x)), np.abs(projection))
+        model = dr.PCA(3, solver='randomized').fit(sp.csr_matrix(x))
+        np.testing.assert_array_almost_equal(expected.eigenvalues, model.eigenvalues)
+
+    def test_incremental_pca(self):
+        expected = dr.PCA(3).fit(self.x)
+        model = dr.IncrementalPCA(3).fit([self.x[:7], self.x[7:50], self.x[50:]])
+        np.testing.assert_array_almost_equal(expected.mean, model.mean)
+        np.testing.assert_array_almost_equal(expected.eigenvalues, model.eigenvalues)
+        np.testing.assert_array_almost_equal(expected.inertias, model.inertias)
+        np.testing.assert_array_almost_equal(np.abs(expected.transform(self.x)), np.abs(model.transform(self.x)))
+        arff = op.join(self.tmp, 'x.arff')
+        mlio.save_arff(self.x, np.arange(80) % 2, arff, classes=[0, 1])
+        model = dr.IncrementalPCA(3).fit_arff(arff, chunk_size=9)
+        np.testing.assert_array_almost_equal(expected.eigenvalues, model.eigenvalues)
+        #Regression arff (REAL class)
+        mlio.save_arff(self.x, np.linspace(0, 3, 80), arff)
+        model = dr.IncrementalPCA(3).fit_arff(arff, chunk_size=9)
+        np.testing.assert_array_almost_equal(expected.eigenvalues, model.eigenvalues)
+        self.check_saved(model, self.x[:5])
+
+    def test_kernel_pca(self):
+        exact, _, _, values, _ = dr.kpca(self.x[:60], 3, sigma=3.0)
+        model = dr.KernelPCA(3, sigma=3.0, chunk_size=25).fit(self.x[:60])
+        np.testing.assert_array_almost_equal(values, model.eigenvalues)
+        #Projecting the training examples gives back the kpca embedding
+        np.testing.assert_array_almost_equal(np.abs(exact), np.abs(model.transform(self.x[:60])))
+        self.check_saved(model, self.x[60:])
+
+    def test_nystrom_kernel_pca(self):
+        poly = {'kernel': kernels.polynomial_kernel, 'degree': 2}
+        exact, _, _, _ = dr.nystrom_kpca(self.x, 2, 40, **poly)
+        model = dr.KernelPCA(2, num_landmarks=40, **poly).fit(self.x)
+        np.testing.assert_array_almost_equal(exact, model.transform(self.x))
+        self.check_saved(model, self.x[:10])
+        self.assertRaises(Exception, dr.KernelPCA(2, kernel=lambda a, b: np.dot(a, b)).fit(self.x).save,
+                          op.join(self.tmp, 'lambda.npz'))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,8 @@
 """ A few kernel functions """
 
 from numpy import *
+import scipy.sparse as sp
+from mayolmol.mlmusings.neighbors import pack_fingerprints, tanimoto
 
 def linear_kernel(x, y):
     return dot(x, y)
@@ -12,10 +14,162 @@ def polynomial_kernel(x, y, degree=3):
 def gaussian_kernel(x, y, sigma=2.0):
     return exp(-sum((x - y) ** 2) ** 2 / (2 * sigma ** 2))
 
-def kernel_matrix(x, kernel=gaussian_kernel, **kernel_params):
+def tanimoto_kernel(x, y):
+    """ Tanimoto (Jaccard) similarity of two binary fingerprints (0 for two empty ones). """
+    union = sum(logical_or(x, y))
+    return sum(logical_and(x, y)) / float(union) if union else 0.0
+
+def minmax_kernel(x, y):
+    """ MinMax similarity of two count fingerprints (0 for two empty ones). """
+    maxs = sum(maximum(x, y))
+    return sum(minimum(x, y)) / float(maxs) if maxs else 0.0
+
+def squared_distance(x, y):
+    """ Not a kernel, but kernel_matrix(x, squared_distance) is the squared distances matrix """
+    return sum((x - y) ** 2)
+
+#Whole-matrix versions of the kernels, K(X, Y) for all the rows of X and Y at once
+
+def squared_distances(x, y):
+    """ Squared euclidean distances between the rows of x and y, as |x|^2 + |y|^2 - 2xy. """
+    d2 = sum(x ** 2, 1)[:, newaxis] + sum(y ** 2, 1)[newaxis, :] - 2 * dot(x, y.T)
+    return maximum(d2, 0, d2)
+
+def linear_kernel_matrix(x, y):
+    return dot(x, y.T)
+
+def polynomial_kernel_matrix(x, y, degree=3):
+    return (1 + dot(x, y.T)) ** degree
+
+def gaussian_kernel_matrix(x, y, sigma=2.0):
+    #Same (squared) squared distance than gaussian_kernel
+    return exp(-squared_distances(x, y) ** 2 / (2 * sigma ** 2))
+
+def tanimoto_kernel_matrix(x, y):
+    """ x and y are bit-packed fingerprints (see neighbors.pack_fingerprints) """
+    return tanimoto(x, y)
+
+#Up to this many different counts, minmax sums the mins with one product per count level
+MINMAX_MAX_LEVELS = 32
+
+def _dense_chunk(x, start, chunk_size):
+    chunk = x[start:start + chunk_size]
+    return chunk.toarray() if sp.issparse(chunk) else asarray(chunk)
+
+def _minmax_counts(x, chunk_size=4096):
+    """ Dense count fingerprints in the smallest unsigned int type that fits them, converted
+        chunk by chunk so no full float copy is ever made. Only if some value is negative or
+        not an integer we fall back to (dense) floats.
+    """
+    if not sp.issparse(x) and asarray(x).dtype.kind in 'ui':
+        return asarray(x)
+    counts = empty(x.shape, dtype=uint8)
+    for start in range(0, x.shape[0], chunk_size):
+        chunk = _dense_chunk(x, start, chunk_size)
+        if chunk.size and (chunk.min() < 0 or not all(chunk == floor(chunk))):
+            return _float_counts(x, chunk_size)
+        top = chunk.max() if chunk.size else 0
+        if top > iinfo(counts.dtype).max:
+            wider = [dtype for dtype in (uint16, uint32, uint64) if top <= iinfo(dtype).max][0]
+            counts = counts.astype(wider)
+        counts[start:start + chunk_size] = chunk
+    return counts
+
+def _float_counts(x, chunk_size):
+    if not sp.issparse(x):
+        return asarray(x)
+    counts = empty(x.shape, dtype=x.dtype)
+    for start in range(0, x.shape[0], chunk_size):
+        counts[start:start + chunk_size] = _dense_chunk(x, start, chunk_size)
+    return counts
+
+def _sum_of_mins(x, y, chunk_size=16):
+    levels = max(x.max() if x.size else 0, y.max() if y.size else 0)
+    integers = x.dtype.kind in 'ui' and y.dtype.kind in 'ui'
+    if integers and x.min() >= 0 and y.min() >= 0 and levels <= MINMAX_MAX_LEVELS:
+        #min(a, b) = sum_t [a >= t][b >= t] for non-negative integers (both a and b)
+        mins = zeros((shape(x)[0], shape(y)[0]), dtype=float32)
+        for level in range(1, int(levels) + 1):
+            mins += dot((x >= level).astype(float32), (y >= level).astype(float32).T)
+        return mins.astype(float64)
+    mins = empty((shape(x)[0], shape(y)[0]))
+    for start in range(0, shape(x)[0], chunk_size):
+        mins[start:start + chunk_size] = minimum(x[start:start + chunk_size, newaxis, :], y[newaxis, :, :]).sum(-1)
+    return mins
+
+def minmax_kernel_matrix(x, y):
+    mins = _sum_of_mins(x, y)
+    maxs = sum(x, 1, dtype=float64)[:, newaxis] + sum(y, 1, dtype=float64)[newaxis, :] - mins
+    return mins / maximum(maxs, 1e-300)
+
+#Pairwise kernel -> whole-matrix kernel; kernels not here go through the (slow) pairwise path
+MATRIX_KERNELS = {squared_distance: squared_distances,
+                  linear_kernel: linear_kernel_matrix,
+                  polynomial_kernel: polynomial_kernel_matrix,
+                  gaussian_kernel: gaussian_kernel_matrix,
+                  tanimoto_kernel: tanimoto_kernel_matrix,
+                  minmax_kernel: minmax_kernel_matrix}
+
+#Conversions applied once to the whole data before tiling, to the format the matrix kernel expects
+KERNEL_INPUTS = {tanimoto_kernel: pack_fingerprints,
+                 minmax_kernel: _minmax_counts}
+
+def kernel_input(x, kernel):
+    """ x in the format the kernel is computed from (e.g. packed fingerprints); calling it on
+        already converted data is harmless, so the conversion can be done once and reused.
+    """
+    if kernel in KERNEL_INPUTS:
+        return KERNEL_INPUTS[kernel](x)
+    return x.toarray() if sp.issparse(x) else x
+
+def _kernel_tile(x, y, kernel, symmetric=False, **kernel_params):
+    if kernel in MATRIX_KERNELS:
+        return MATRIX_KERNELS[kernel](x, y, **kernel_params)
+    K = zeros((shape(x)[0], shape(y)[0]))
+    for i in range(shape(x)[0]):
+        for j in range(i if symmetric else 0, shape(y)[0]):  #Let's not assume K[i][i] == 1
+            K[i, j] = kernel(x[i], y[j], **kernel_params)
+            if symmetric:
+                K[j, i] = K[i, j]
+    return K
+
+def kernel_diagonal(x, kernel=gaussian_kernel, tile_size=256, **kernel_params):
+    """ k(x, x) for each row of x, without computing the whole kernel matrix
+        (nor converting the whole x to the kernel input).
+    """
+    diagonal = empty(shape(x)[0])
+    for i in range(0, shape(x)[0], tile_size):
+        tile = kernel_input(x[i:i + tile_size], kernel)
+        diagonal[i:i + tile_size] = diag(_kernel_tile(tile, tile, kernel, symmetric=True, **kernel_params))
+    return diagonal
+
+def cross_kernel_matrix(x, y, kernel=gaussian_kernel, tile_size=1024, dtype=float64, **kernel_params):
+    """ The (rows of x) x (rows of y) kernel matrix, e.g. to project out-of-sample examples,
+        computed in tiles of tile_size x tile_size.
+    """
+    x, y = kernel_input(x, kernel), kernel_input(y, kernel)
+    K = empty((shape(x)[0], shape(y)[0]), dtype=dtype)
+    for i in range(0, shape(x)[0], tile_size):
+        for j in range(0, shape(y)[0], tile_size):
+            K[i:i + tile_size, j:j + tile_size] = _kernel_tile(x[i:i + tile_size], y[j:j + tile_size],
+                                                               kernel, **kernel_params)
+    return K
+
+def kernel_matrix(x, kernel=gaussian_kernel, tile_size=1024, dtype=float64, **kernel_params):
+    """ The kernel matrix of the rows of x, computed in tiles of tile_size x tile_size.
+        Only the tiles on and above the diagonal are computed, the rest are mirrored.
+        Kernels in MATRIX_KERNELS are vectorized, any other pairwise kernel(x, y, **kernel_params)
+        is evaluated once per pair.
+        Fingerprint kernels (tanimoto, minmax) accept dense or sparse fingerprints.
+        Use dtype=float32 to halve the memory of big matrices.
+    """
+    x = kernel_input(x, kernel)
     numE = shape(x)[0]
-    K = zeros((numE, numE))
-    for i in range(numE):
-        for j in range(i, numE):  #Let's not assume K[i][i] == 1
-            K[i,j] = K[j,i] = kernel(x[i], x[j], **kernel_params) #Slow, optimize this by inlining and using matix ops
-    return K
\ No newline at end of file
+    K = empty((numE, numE), dtype=dtype)
+    for i in range(0, numE, tile_size):
+        for j in range(i, numE, tile_size):
+            tile = _kernel_tile(x[i:i + tile_size], x[j:j + tile_size], kernel, symmetric=(i == j), **kernel_params)
+            K[i:i + tile_size, j:j + tile_size] = tile
+            if i != j:
+                K[j:j + tile_size, i:i + tile_size] = tile.T
+    return K
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+import scipy.sparse as sp
+from mayolmol.mlmusings import kernels
+
+def pairwise_kernel_matrix(x, y, kernel, **kernel_params):
+    return np.array([[kernel(a, b, **kernel_params) for b in y] for a in x])
+
+class KernelMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.x = rng.normal(size=(40, 5))
+        self.y = rng.normal(size=(15, 5))
+
+    def test_kernel_matrix(self):
+        for kernel, params in ((kernels.linear_kernel, {}),
+                               (kernels.polynomial_kernel, {'degree': 2}),
+                               (kernels.gaussian_kernel, {'sigma': 5.0})):
+            expected = pairwise_kernel_matrix(self.x, self.x, kernel, **params)
+            np.testing.assert_array_almost_equal(expected, kernels.kernel_matrix(self.x, kernel, tile_size=16, **params))
+            np.testing.assert_array_almost_equal(pairwise_kernel_matrix(self.x, self.y, kernel, **params),
+                                                 kernels.cross_kernel_matrix(self.x, self.y, kernel, tile_size=16, **params))
+        K = kernels.kernel_matrix(self.x, dtype=np.float32)
+        self.assertEqual(np.float32, K.dtype)
+
+    def test_pairwise_fallback(self):
+        manhattan = lambda a, b, scale=1.0: np.abs(a - b).sum() / scale
+        expected = pairwise_kernel_matrix(self.x, self.x, manhattan, scale=2.0)
+        np.testing.assert_array_almost_equal(expected, kernels.kernel_matrix(self.x, manhattan, tile_size=16, scale=2.0))
+
+    def test_fingerprint_kernels(self):
+        rng = np.random.RandomState(0)
+        fps = (rng.rand(50, 130) < 0.2).astype(np.float64)
+        fps[3] = 0
+        counts = fps * rng.randint(1, 5, fps.shape)
+        for kernel, x in ((kernels.tanimoto_kernel, fps), (kernels.minmax_kernel, counts)):
+            expected = pairwise_kernel_matrix(x, x, kernel)
+            np.testing.assert_array_almost_equal(expected, kernels.kernel_matrix(x, kernel, tile_size=16))
+            np.testing.assert_array_almost_equal(expected, kernels.kernel_matrix(sp.csr_matrix(x), kernel))
+            np.testing.assert_array_almost_equal(expected[:, :7], kernels.cross_kernel_matrix(x, x[:7], kernel))
+        #Non-integer values go through the chunked minimum
+        x = counts / 3.0
+        np.testing.assert_array_almost_equal(pairwise_kernel_matrix(x, x, kernels.minmax_kernel),
+                                             kernels.kernel_matrix(x, kernels.minmax_kernel))
+        #Integer counts against non-integer values (e.g. KernelPCA.transform)
+        np.testing.assert_array_almost_equal(pairwise_kernel_matrix(counts, x[:7], kernels.minmax_kernel),
+                                             kernels.cross_kernel_matrix(counts, x[:7], kernels.minmax_kernel))
+
+    def test_minmax_counts(self):
+        counts = np.random.RandomState(0).randint(0, 4, (30, 20)).astype(np.float64)
+        converted = kernels.kernel_input(sp.csr_matrix(counts), kernels.minmax_kernel)
+        self.assertEqual(np.uint8, converted.dtype)
+        np.testing.assert_array_equal(counts, converted)
+        counts[25, 3] = 300
+        converted = kernels._minmax_counts(sp.csr_matrix(counts), chunk_size=7)
+        self.assertEqual(np.uint16, converted.dtype)
+        np.testing.assert_array_equal(counts, converted)
+        counts[28, 0] = 0.5
+        converted = kernels._minmax_counts(sp.csr_matrix(counts), chunk_size=7)
+        self.assertEqual(np.float64, converted.dtype)
+        np.testing.assert_array_equal(counts, converted)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,108 +1,553 @@
 # -*- coding: utf-8 -*-
-""" Simple I/O without dependencies to any non-standard package other than numpy.
+""" Simple I/O without dependencies to any non-standard package other than numpy (and scipy.sparse).
     mldata-utils, arff, orange and the like could be useful here.
     Requires python >= 2.6
 """
 from __future__ import with_statement
+import array
+import bz2
+import gzip
+import hashlib
+import multiprocessing
+import os
 import os.path as op
+import shutil
 import shlex
+import tempfile
 import csv
 import math
 import numpy as np
-import pybel
+import scipy.sparse as sp
+
+#Big buffers for the (usually huge) text files we write
+WRITE_BUFFER_SIZE = 2 ** 22
+
+#Parsed arffs are cached in src + ARFF_CACHE_SUFFIX, keyed by size, mtime and a hash of these many bytes at each end
+ARFF_CACHE_SUFFIX = '.npycache'
+CACHE_HASH_BYTES = 2 ** 20
+
+#Upper bound for the chunks of text each worker reads at once in load_arff_parallel
+PARALLEL_RANGE_BYTES = 2 ** 26
 
 def generate_names(num, prefix='f-'):
     num_digits = len(str(num - 1))
     return [prefix + str(fNum).zfill(num_digits) for fNum in range(num)]
 
-def load_arff(src, rename_classes = True):
-    """ Load a dense arff with continuous features and a class as the last attribute.
-        No support for sparsity, string, nominal or date attributes, missing values,
-        weights, comments and other goodies, no error checking, but this will do for the moment.
-        There are many alternatives, the only one that does not add dependencies is
-        scipy's arffloader, but it is quite buggy at the moment.
+def is_compressed(src):
+    return src.endswith('.gz') or src.endswith('.bz2')
+
+def open_file(src, mode='r', buffering=-1):
+    """ Like open, but .gz and .bz2 files (detected by extension) are transparently
+        (de)compressed while streaming, so there is no extra pass over the data.
+        Seeking compressed files works, but it is slow.
+    """
+    if src.endswith('.gz'):
+        return gzip.open(src, mode.replace('b', '') + 'b', 6)  #zlib's default level, 9 is much slower
+    if src.endswith('.bz2'):
+        return bz2.BZ2File(src, mode.replace('b', '') + 'b')
+    return open(src, mode, buffering)
+
+def _read_arff_header(src):
+    """ Parse the header of an open arff, leaving src positioned at the first @data row.
+        Uses readline (and not file iteration) so that src.tell() is meaningful afterwards.
     """
     name = None
     attributes = []
     classes = {}
-    x = []
-    y = []
-    with open(src) as src:
-        #Relation name
+    #Relation name
+    for line in iter(src.readline, ''):
+        if line.strip().lower().startswith('@relation'):
+            name = shlex.split(line.strip())[1]
+            break
+    #Attributes
+    for line in iter(src.readline, ''):
+        if line.strip().lower().startswith('@attribute'):
+            _, fName, spec = shlex.split(line.strip())
+            attributes.append(fName)
+            if spec.startswith('{'):
+                for clazz in spec[1:-1].split(','):
+                    classes[clazz.strip()] = len(classes)
+        elif line.strip().lower().startswith('@data'):
+            break
+    return name, attributes, classes
+
+def read_arff_header(src):
+    """ Return the relation name, the attribute names, the class map of an arff
+        and the byte offset at which its @data section starts.
+    """
+    with open_file(src) as src:
+        name, attributes, classes = _read_arff_header(src)
+        return name, attributes, classes, src.tell()
+
+def _parse_value(value):
+    value = value.strip()
+    return np.nan if value == '?' else float(value)
+
+def _parse_class(clazz, classes, rename_classes):
+    clazz = clazz.strip()
+    if clazz == '?':
+        return np.nan
+    if rename_classes:
+        return classes[clazz]
+    return float(clazz)
+
+def _parse_instance(data, x, y, row, classes, rename_classes):
+    """ Store an already split @data row into x[row] and y[row], '?' becomes NaN. """
+    try:
+        x[row] = data[:-1]
+    except ValueError:
+        x[row] = map(_parse_value, data[:-1])
+    y[row] = _parse_class(data[-1], classes, rename_classes)
+
+def iter_arff(src, chunk_size=4096, dtype=np.float64, rename_classes=True):
+    """ Iterate over the instances of a dense arff in blocks of at most chunk_size rows.
+        Yields (x, y) pairs where x is a freshly allocated (rows x features) array of dtype
+        and y the matching slice of the class attribute, so peak memory is bounded by
+        chunk_size and not by the size of the dataset.
+        See load_arff for the (small) subset of the format that is supported.
+    """
+    with open_file(src) as src:
+        _, attributes, classes = _read_arff_header(src)
+        num_values = len(attributes)
+        x = np.empty((chunk_size, num_values - 1), dtype=dtype)
+        y = np.empty(chunk_size)
+        row = 0
         for line in src:
-            if line.strip().lower().startswith('@relation'):
-                name = shlex.split(line.strip())[1]
-                break
-                #Attributes
+            data = line.strip().split(',')
+            if len(data) != num_values:  #Lame check
+                continue
+            _parse_instance(data, x, y, row, classes, rename_classes)
+            row += 1
+            if row == chunk_size:
+                yield x, y
+                x = np.empty((chunk_size, num_values - 1), dtype=dtype)
+                y = np.empty(chunk_size)
+                row = 0
+        if row:
+            yield x[:row], y[:row]
+
+def load_arff(src, rename_classes=True, dtype=np.float64, cache=False):
+    """ Load a dense arff with continuous features and a class as the last attribute.
+        No support for sparsity, string, nominal or date attributes, weights, comments
+        and other goodies, no error checking, but this will do for the moment.
+        Missing values ('?') are read as NaN.
+        There are many alternatives, the only one that does not add dependencies is
+        scipy's arffloader, but it is quite buggy at the moment.
+        Use iter_arff to process files that do not fit in memory.
+        If cache is True the parsed arrays are kept in a binary sidecar (see read_arff_cache).
+    """
+    if cache:
+        cached = read_arff_cache(src, 'dense', rename_classes, dtype)
+        if cached:
+            return cached
+    name, attributes, classes, _ = read_arff_header(src)
+    blocks = list(iter_arff(src, rename_classes=rename_classes, dtype=dtype))
+    if not blocks:
+        x, y = np.array([]), np.array([])
+    else:
+        x = np.vstack([block for block, _ in blocks])
+        y = np.concatenate([block for _, block in blocks])
+    if cache:
+        write_arff_cache(src, 'dense', rename_classes, dtype, name, attributes, classes, x, y)
+    return name, attributes, classes, x, y
+
+def arff_to_npy(src, dest, chunk_size=4096, dtype=np.float64):
+    """ Stream the features of a dense arff into the .npy file dest, block by block with iter_arff,
+        so that memory is bounded by chunk_size whatever the size of the arff (at the price of
+        parsing it twice, the first time just to count the instances).
+        Returns x memory-mapped read-only from dest.
+    """
+    name, attributes, classes, _ = read_arff_header(src)
+    #Only the features are kept; nominal classes must be renamed, REAL ones must not
+    rename_classes = bool(classes)
+    num_instances = sum(len(block) for block, _ in iter_arff(src, chunk_size, dtype, rename_classes))
+    x = np.lib.format.open_memmap(dest, mode='w+', dtype=dtype, shape=(num_instances, len(attributes) - 1))
+    row = 0
+    for block, _ in iter_arff(src, chunk_size, dtype, rename_classes):
+        x[row:row + len(block)] = block
+        row += len(block)
+    x.flush()
+    del x
+    return np.load(dest, mmap_mode='r')
+
+def _line_aligned_ranges(src, start, num_ranges):
+    """ Split the bytes [start, EOF) of src in (at most) num_ranges ranges that start at line boundaries. """
+    size = op.getsize(src)
+    bounds = [start]
+    with open(src, 'rb') as src:
+        for i in xrange(1, num_ranges):
+            src.seek(start + (size - start) * i // num_ranges)
+            src.readline()
+            if bounds[-1] < src.tell() < size:
+                bounds.append(src.tell())
+    bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+def _read_range(src, start, end):
+    with open(src, 'rb') as src:
+        src.seek(start)
+        return src.read(end - start).splitlines()
+
+def _count_range_instances(args):
+    src, start, end, num_values = args
+    return sum(1 for line in _read_range(src, start, end) if line.strip().count(',') == num_values - 1)
+
+def _parse_range_instances(args):
+    src, start, end, num_values, classes, rename_classes, x_file, y_file, shape, dtype, row = args
+    x = np.memmap(x_file, dtype=dtype, mode='r+', shape=shape)
+    y = np.memmap(y_file, dtype=np.float64, mode='r+', shape=shape[:1])
+    for line in _read_range(src, start, end):
+        data = line.strip().split(',')
+        if len(data) != num_values:  #Lame check
+            continue
+        _parse_instance(data, x, y, row, classes, rename_classes)
+        row += 1
+    x.flush()
+    y.flush()
+
+def load_arff_parallel(src, rename_classes=True, dtype=np.float64, processes=None, tmp_dir=None):
+    """ Like load_arff, but the @data section is split in line-aligned byte ranges that
+        are parsed by a pool of processes straight into a shared memory-mapped array,
+        preserving the row order.
+        The memmap lives in an already unlinked file in tmp_dir, so it goes away with x.
+        Compressed files cannot be split, they are just handed to load_arff.
+    """
+    if is_compressed(src):
+        return load_arff(src, rename_classes=rename_classes, dtype=dtype)
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    name, attributes, classes, data_start = read_arff_header(src)
+    num_values = len(attributes)
+    num_ranges = max(4 * processes, op.getsize(src) // PARALLEL_RANGE_BYTES)
+    ranges = _line_aligned_ranges(src, data_start, num_ranges)
+    pool = multiprocessing.Pool(processes)
+    try:
+        counts = pool.map(_count_range_instances, [(src, start, end, num_values) for start, end in ranges])
+        shape = (sum(counts), num_values - 1)
+        if not shape[0]:
+            return name, attributes, classes, np.array([]), np.array([])
+        work_dir = tempfile.mkdtemp(dir=tmp_dir)
+        try:
+            x_file, y_file = op.join(work_dir, 'x'), op.join(work_dir, 'y')
+            x = np.memmap(x_file, dtype=dtype, mode='w+', shape=shape)
+            y = np.memmap(y_file, dtype=np.float64, mode='w+', shape=shape[:1])
+            first_rows = np.cumsum([0] + counts[:-1])
+            pool.map(_parse_range_instances,
+                     [(src, start, end, num_values, classes, rename_classes, x_file, y_file, shape, dtype, row)
+                      for (start, end), row in zip(ranges, first_rows)])
+        finally:
+            shutil.rmtree(work_dir)
+    finally:
+        pool.close()
+        pool.join()
+    return name, attributes, classes, x, np.array(y)
+
+def load_sparse_arff(src, rename_classes=True, dtype=np.float64, cache=False):
+    """ Load a sparse arff ({index value, ...} rows, like JCompoundMapper's WEKA_HASHED output)
+        into a scipy.sparse CSR matrix, never building the dense matrix.
+        Same assumptions as load_arff: continuous features and the class as the last attribute.
+        Omitted values are 0, so an omitted nominal class is its first declared value.
+        If cache is True the parsed arrays are kept in a binary sidecar (see read_arff_cache).
+    """
+    if cache:
+        cached = read_arff_cache(src, 'sparse', rename_classes, dtype)
+        if cached:
+            return cached
+    name, attributes, classes, x, y = _load_sparse_arff(src, rename_classes, dtype)
+    if cache:
+        write_arff_cache(src, 'sparse', rename_classes, dtype, name, attributes, classes, x, y)
+    return name, attributes, classes, x, y
+
+def _load_sparse_arff(src, rename_classes, dtype):
+    with open_file(src) as src:
+        name, attributes, classes = _read_arff_header(src)
+        class_index = len(attributes) - 1
+        if classes:
+            default_class = _parse_class(min(classes, key=classes.get), classes, rename_classes)
+        else:
+            default_class = 0.0
+        indices = array.array('i')
+        data = array.array('d')
+        indptr = array.array('l', [0])
+        y = array.array('d')
         for line in src:
-            if line.strip().lower().startswith('@attribute'):
-                _, fName, spec = shlex.split(line.strip())
-                attributes.append(fName)
-                if spec.startswith('{'):
-                    for clazz in spec[1:-1].split(','):
-                        classes[clazz.strip()] = len(classes)
-            elif line.strip().lower().startswith('@data'):
-                break
-                #Data
-        if rename_classes:
-            for line in src:
-                data = line.strip().split(',')
-                if len(data) == len(attributes):  #Lame check
-                    x.append(map(float, data[:-1]))
-                    y.append(classes[data[-1]])
+            line = line.strip()
+            if not line.startswith('{'):  #Lame check
+                continue
+            tokens = line[1:-1].replace(',', ' ').split()
+            if tokens and int(tokens[-2]) == class_index:
+                y.append(_parse_class(tokens[-1], classes, rename_classes))
+                tokens = tokens[:-2]
+            else:
+                y.append(default_class)
+            indices.extend(map(int, tokens[0::2]))
+            try:
+                data.extend(map(float, tokens[1::2]))
+            except ValueError:
+                data.extend(map(_parse_value, tokens[1::2]))
+            indptr.append(len(indices))
+    #Copy out of the array.array buffers, numpy views on them would be read-only
+    x = sp.csr_matrix((np.frombuffer(data, dtype=np.float64).astype(dtype),
+                       np.frombuffer(indices, dtype=np.intc).copy(),
+                       np.frombuffer(indptr, dtype=np.int_).copy()),
+                      shape=(len(y), class_index))
+    return name, attributes, classes, x, np.frombuffer(y, dtype=np.float64).copy()
+
+def _file_key(src):
+    """ Cheap identity of a file: size, mtime and a hash of its head and tail.
+        Hashing everything would defeat the purpose of the cache for big files.
+    """
+    stat = os.stat(src)
+    digest = hashlib.md5()
+    with open(src, 'rb') as src:
+        digest.update(src.read(CACHE_HASH_BYTES))
+        if stat.st_size > CACHE_HASH_BYTES:
+            src.seek(max(CACHE_HASH_BYTES, stat.st_size - CACHE_HASH_BYTES))
+            digest.update(src.read())
+    return '%d-%r-%s' % (stat.st_size, stat.st_mtime, digest.hexdigest())
+
+def _arff_cache_dir(src, kind, rename_classes, dtype):
+    return op.join(src + ARFF_CACHE_SUFFIX,
+                   '%s-%s-%s' % (kind, np.dtype(dtype).name, 'renamed' if rename_classes else 'raw'))
+
+def read_arff_cache(src, kind='dense', rename_classes=True, dtype=np.float64, mmap_mode='c'):
+    """ Return what load_arff (kind='dense') or load_sparse_arff (kind='sparse') would return
+        for src, memory-mapping the arrays from the sidecar written by write_arff_cache,
+        or None if there is no sidecar or it is stale.
+        With the default copy-on-write mmap_mode, several processes share the same pages
+        and in-place modifications never reach the disk.
+    """
+    cache_dir = _arff_cache_dir(src, kind, rename_classes, dtype)
+    meta_file = op.join(cache_dir, 'meta.npz')
+    if not op.exists(meta_file):
+        return None
+    meta = np.load(meta_file)
+    if str(meta['key']) != _file_key(src):
+        return None
+    load = lambda name: np.load(op.join(cache_dir, name + '.npy'), mmap_mode=mmap_mode)
+    if kind == 'sparse':
+        x = sp.csr_matrix((load('data'), load('indices'), load('indptr')), shape=tuple(meta['shape']))
+    else:
+        x = load('x')
+    classes = dict(zip(meta['class_names'].tolist(), meta['class_indices'].tolist()))
+    return str(meta['name']), meta['attributes'].tolist(), classes, x, load('y')
+
+def write_arff_cache(src, kind, rename_classes, dtype, name, attributes, classes, x, y):
+    """ Save the parsed contents of an arff to a binary sidecar next to it (src + ARFF_CACHE_SUFFIX).
+        The sidecar is a cache: failing to write it (e.g. read-only directory) is not an error.
+    """
+    cache_dir = _arff_cache_dir(src, kind, rename_classes, dtype)
+    tmp_dir = cache_dir + '-tmp-%d' % os.getpid()
+    try:
+        if not op.exists(tmp_dir):
+            os.makedirs(tmp_dir)
+        if kind == 'sparse':
+            arrays = {'data': x.data, 'indices': x.indices, 'indptr': x.indptr}
         else:
-            for line in src:
-                data = line.strip().split(',')
-                if len(data) == len(attributes):  #Lame check
-                    x.append(map(float, data[:-1]))
-                    y.append(float(data[-1]))
-            
-    return name, attributes, classes, np.array(x), np.array(y)
+            arrays = {'x': x}
+        arrays['y'] = y
+        for array_name, values in arrays.items():
+            np.save(op.join(tmp_dir, array_name + '.npy'), values)
+        class_names = sorted(classes, key=classes.get)
+        np.savez(op.join(tmp_dir, 'meta.npz'),
+                 key=np.array(_file_key(src)),
+                 name=np.array(name or ''),
+                 attributes=np.array(attributes),
+                 class_names=np.array(class_names),
+                 class_indices=np.array([classes[clazz] for clazz in class_names], dtype=int),
+                 shape=np.array(x.shape))
+        if op.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.rename(tmp_dir, cache_dir)
+    except (IOError, OSError):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def load_libsvm(src, num_features=None, zero_based=False, dtype=np.float64):
+    """ Load a LIBSVM sparse file ('label index:value ...' rows, indices starting at 1 unless
+        zero_based) into a CSR matrix and an array with the labels.
+        By default the number of features is the largest index seen.
+    """
+    indices = array.array('i')
+    data = array.array('d')
+    indptr = array.array('l', [0])
+    y = array.array('d')
+    with open_file(src) as src:
+        for line in src:
+            tokens = line.partition('#')[0].replace(':', ' ').split()
+            if not tokens:
+                continue
+            y.append(float(tokens[0]))
+            indices.extend(map(int, tokens[1::2]))
+            data.extend(map(float, tokens[2::2]))
+            indptr.append(len(indices))
+    indices = np.frombuffer(indices, dtype=np.intc).copy()
+    if not zero_based:
+        indices -= 1
+    if num_features is None:
+        num_features = indices.max() + 1 if len(indices) else 0
+    x = sp.csr_matrix((np.frombuffer(data, dtype=np.float64).astype(dtype),
+                       indices,
+                       np.frombuffer(indptr, dtype=np.int_).copy()),
+                      shape=(len(y), num_features))
+    return x, np.frombuffer(y, dtype=np.float64).copy()
+
+def save_libsvm(x, y, dest, zero_based=False, format='%.8g'):
+    """ Save a (sparse or dense) matrix and its labels in LIBSVM sparse format. """
+    x = sp.csr_matrix(x)
+    x.sort_indices()
+    pairfmt = '%d:' + format
+    first_index = 0 if zero_based else 1
+    with open_file(dest, 'w', WRITE_BUFFER_SIZE) as dest:
+        indices, data, indptr = (x.indices + first_index).tolist(), x.data.tolist(), x.indptr.tolist()
+        for row, label in enumerate(np.asarray(y).tolist()):
+            start, end = indptr[row], indptr[row + 1]
+            pairs = [pairfmt % pair for pair in zip(indices[start:end], data[start:end])]
+            dest.write(' '.join([format % label] + pairs) + '\n')
+
+def _libsvm_matrix_rows(src):
+    with open_file(src) as src:
+        for line in src:
+            line = line.partition('#')[0].strip()
+            if line:
+                yield line
+
+def load_libsvm_matrix(src, dtype=np.float64):
+    """ Load a LIBSVM precomputed kernel file ('label 0:serial 1:k(x, x1) 2:k(x, x2) ...', like
+        JCompoundMapper's LIBSVM_MATRIX) into a dense kernel matrix.
+        A first cheap pass over the text sizes the matrix, so no row list is ever built.
+        Returns the kernel matrix, the labels and the serial numbers of the rows.
+    """
+    num_rows = num_columns = 0
+    for line in _libsvm_matrix_rows(src):
+        num_rows += 1
+        last = line.rsplit(None, 1)[-1]
+        if ':' in last:
+            num_columns = max(num_columns, int(last.partition(':')[0]))
+    K = np.zeros((num_rows, num_columns), dtype=dtype)
+    y = np.empty(num_rows)
+    serials = np.arange(1, num_rows + 1)
+    for i, line in enumerate(_libsvm_matrix_rows(src)):
+        tokens = line.replace(':', ' ').split()
+        y[i] = float(tokens[0])
+        columns = np.array(tokens[1::2], dtype=int)
+        values = np.array(tokens[2::2], dtype=dtype)
+        if len(columns) and columns[0] == 0:
+            serials[i] = int(values[0])
+            columns, values = columns[1:], values[1:]
+        K[i, columns - 1] = values
+    return K, y, serials
+
+def _format_dense(x, format, sep, missing):
+    rowfmt = sep.join([format] * x.shape[1])
+    rows = [rowfmt % tuple(row) for row in x.tolist()]
+    if x.dtype.kind == 'f':
+        missing_mask = np.isnan(x)
+        for i in np.flatnonzero(missing_mask.any(axis=1)):
+            rows[i] = sep.join([missing if is_missing else format % value
+                                for value, is_missing in zip(x[i].tolist(), missing_mask[i])])
+    return rows
+
+def _format_bits(x, sep):
+    """ 0/1 columns are written straight as bytes, no per-value formatting at all. """
+    ne, nf = x.shape
+    width = 2 * nf - 1
+    chars = np.empty((ne, width), dtype=np.uint8)
+    chars[:, 0::2] = x
+    chars[:, 0::2] += ord('0')
+    chars[:, 1::2] = ord(sep)
+    text = chars.tostring()
+    return [text[i * width:(i + 1) * width] for i in xrange(ne)]
+
+def _format_instances(x, y, format='%.8g', sep=',', missing='?', newline='\n'):
+    """ Format a block of instances as delimited text, one line per row.
+        NaNs are written as missing. The trailing run of 0/1 columns (usually a
+        fingerprint, maybe after an id and some descriptors) takes the byte fast path,
+        unless format would not write them as plain 0 and 1 (e.g. '%.3f').
+    """
+    ne, nf = x.shape
+    if format % 0 == '0' and format % 1 == '1':
+        is_bit = ((x == 0) | (x == 1)).all(axis=0)
+        not_bits = np.flatnonzero(~is_bit)
+        num_dense = not_bits[-1] + 1 if len(not_bits) else 0
+    else:
+        num_dense = nf
+    columns = []
+    if num_dense:
+        columns.append(_format_dense(x[:, :num_dense], format, sep, missing))
+    if num_dense < nf:
+        columns.append(_format_bits(x[:, num_dense:], sep))
+    y_missing = np.isnan(y) if y.dtype.kind == 'f' else np.zeros(ne, dtype=bool)
+    columns.append([missing if is_missing else str(value) for value, is_missing in zip(y, y_missing)])
+    return newline.join([sep.join(row) for row in zip(*columns)]) + newline
+
+def write_instances(dest, x, y, format='%.8g', sep=',', missing='?', newline='\n', chunk_size=4096):
+    """ Write the instances (rows of x plus the class y) to the open file dest,
+        formatting chunk_size rows at a time.
+    """
+    y = np.asarray(y)
+    for start in xrange(0, x.shape[0], chunk_size):
+        dest.write(_format_instances(x[start:start + chunk_size], y[start:start + chunk_size],
+                                     format=format, sep=sep, missing=missing, newline=newline))
 
 def save_tab(x, y, dest, format='%.8g', classes=None):
     """ This should be saved with .txt or .csv extension, it is NOT tab
      See http://orange.biolab.si/doc/reference/tabdelimited.htm
     """
     ne, nf = x.shape
-    writer = csv.writer(open(dest, "w"), delimiter='\t')
-    writer.writerow(['C#feature-' + str(i) for i in range(nf)] + (['cD#class'] if classes else ['c#class']))
-    for i in range(ne):
-        row = []
-        for j in range(nf):
-            row += [format % x[i][j]]
-        row += [y[i]]
-        writer.writerow(row)
+    with open_file(dest, 'w', WRITE_BUFFER_SIZE) as dest:
+        writer = csv.writer(dest, delimiter='\t')
+        writer.writerow(['C#feature-' + str(i) for i in range(nf)] + (['cD#class'] if classes else ['c#class']))
+        write_instances(dest, x, y, format=format, sep='\t', newline='\r\n')
+
+def _write_arff_header(dest, relation_name, feature_names, classes):
+    dest.write('@relation ' + relation_name + '\n\n')
+    for fName in feature_names:
+        dest.write('@attribute ' + fName + ' real\n')
+    if not classes:
+        classes = 'REAL'
+    else:
+        classes = '{' +','.join(map(str,classes)) + '}'
+    #        classes = ",".join(map(str, map(int, sorted(np.unique(y)))))
+    dest.write('@attribute class ' + classes + '\n')
+    dest.write('@data\n')
 
 def save_arff(x, y, dest, relation_name=None, feature_names=None, format='%.8g', classes=None):
     #x is the matrix of (instances*descriptors) and y is the vector of classes. The attributes values are reals here.
     ne, nf = x.shape
     if not feature_names: feature_names = generate_names(nf)
     if not relation_name: relation_name = op.splitext(op.split(dest)[1])[0]
-    with open(dest, 'w') as dest:
-        dest.write('@relation ' + relation_name + '\n\n')
-        for fName in feature_names:
-            dest.write('@attribute ' + fName + ' real\n')
-        if not classes:
-            classes = 'REAL'
-        else:
-            classes = '{' +','.join(map(str,classes)) + '}'
-        #        classes = ",".join(map(str, map(int, sorted(np.unique(y)))))
-        dest.write('@attribute class ' + classes + '\n')
-        dest.write('@data\n')
+    with open_file(dest, 'w', WRITE_BUFFER_SIZE) as dest:
+        _write_arff_header(dest, relation_name, feature_names, classes)
+        write_instances(dest, x, y, format=format)
+
+def save_sparse_arff(x, y, dest, relation_name=None, feature_names=None, format='%.8g', classes=None):
+    """ Save a scipy.sparse matrix (and the class y) as a sparse arff, see save_arff. """
+    x = sp.csr_matrix(x)
+    x.sort_indices()
+    y = np.asarray(y)
+    ne, nf = x.shape
+    if not feature_names: feature_names = generate_names(nf)
+    if not relation_name: relation_name = op.splitext(op.split(dest)[1])[0]
+    pairfmt = '%d ' + format
+    with open_file(dest, 'w', WRITE_BUFFER_SIZE) as dest:
+        _write_arff_header(dest, relation_name, feature_names, classes)
+        indices, data, indptr = x.indices.tolist(), x.data.tolist(), x.indptr.tolist()
         for row in xrange(ne):
-            instance = map(lambda a: format % a if not np.isnan(a) else '?', x[row, :])
-            dest.write(','.join(instance))
-            dest.write(',' +(str(y[row]) if not np.isnan(y[row]) else '?') + '\n')
+            start, end = indptr[row], indptr[row + 1]
+            values = [pairfmt % pair for pair in zip(indices[start:end], data[start:end])]
+            clazz = y[row]
+            values.append('%d %s' % (nf, str(clazz) if not (y.dtype.kind == 'f' and np.isnan(clazz)) else '?'))
+            dest.write('{' + ','.join(values) + '}\n')
 
 def mergearffs(dest, arff1, *args):
     if not dest:
         dest = op.splitext(arff1)[0] + '-merged.arff'
-    with open(dest, 'w') as dest:
-        with open(arff1) as src:
+    with open_file(dest, 'w', WRITE_BUFFER_SIZE) as dest:
+        with open_file(arff1) as src:
             for line in src:
                 dest.write(line)
         for other_arff in args:
-            with open(other_arff) as src:
+            with open_file(other_arff) as src:
                 for line in src:
                     if line.strip() == '@data':
                         break
@@ -130,14 +575,288 @@ def merge_arff2(directory, dest_arff, arff1, arff2, rename_classes):
     save_arff(x, y, output_file, relation_name = relation, feature_names = attributes, classes = classes)
     return  relation, classes, attributes, x, y
 
+def _arff_id(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value.strip()
+
+def _read_arff_header_lines(src):
+    """ The header lines of an open arff, up to and including @data. """
+    lines = []
+    for line in iter(src.readline, ''):
+        lines.append(line.strip())
+        if line.strip().lower().startswith('@data'):
+            break
+    return lines
+
+def _index_arff_rows(src):
+    """ Map instance id (the first value) -> byte offset of its row, for an open arff positioned at @data. """
+    index = {}
+    offset = src.tell()
+    for line in src:
+        values = line.strip()
+        if values and not values.startswith('%'):
+            index[_arff_id(values.partition(',')[0])] = offset
+        offset += len(line)
+    return index
+
+def merge_arffs(dest, arffs, relation_name=None):
+    """ Single pass horizontal merge of arffs that describe the same instances with different
+        features. All of them have the id of the instances as first attribute and the class as
+        the last one: the result keeps the id and class of the first file and appends the
+        features of the others. Rows are joined on the id using a (id -> byte offset) index of
+        the other files, so they do not need to be in the same order; instances missing in
+        any of the files are dropped. Values are copied as text and nothing but the indices is
+        kept in memory. Returns the number of instances written.
+    """
+    files = [open_file(arff, 'rb') for arff in arffs]
+    try:
+        headers = [_read_arff_header_lines(src) for src in files]
+        attributes = [[line for line in header if line.lower().startswith('@attribute')] for header in headers]
+        indices = [_index_arff_rows(src) for src in files[1:]]
+        next_offsets = [None] * len(indices)
+        num_written = 0
+        with open_file(dest, 'w', WRITE_BUFFER_SIZE) as dest:
+            if relation_name:
+                dest.write('@relation ' + relation_name + '\n\n')
+            else:
+                dest.write([line for line in headers[0] if line.lower().startswith('@relation')][0] + '\n\n')
+            for line in attributes[0][:-1]:
+                dest.write(line + '\n')
+            for other in attributes[1:]:
+                for line in other[1:-1]:
+                    dest.write(line + '\n')
+            dest.write(attributes[0][-1] + '\n')
+            dest.write('@data\n')
+            for line in files[0]:
+                values = line.strip()
+                if not values or values.startswith('%'):
+                    continue
+                instance_id, _, values = values.partition(',')
+                features, _, clazz = values.rpartition(',')
+                row = [instance_id, features]
+                key = _arff_id(instance_id)
+                for i, (src, index) in enumerate(zip(files[1:], indices)):
+                    offset = index.get(key)
+                    if offset is None:
+                        break
+                    if offset != next_offsets[i]:  #Seek only if the rows are not in the same order
+                        src.seek(offset)
+                    other = src.readline()
+                    next_offsets[i] = offset + len(other)
+                    row.append(other.strip().partition(',')[2].rpartition(',')[0])
+                else:
+                    dest.write(','.join([value for value in row if value]) + ',' + clazz + '\n')
+                    num_written += 1
+        return num_written
+    finally:
+        for src in files:
+            src.close()
+
+def _sdf_tag_name(line):
+    """ The name of a data header line like '>  <Tox>  (1)' """
+    start = line.find('<')
+    end = line.find('>', start + 1)
+    if start < 0 or end < 0:
+        return None
+    return line[start + 1:end]
+
+def _scan_sdf_records(src, fields=None):
+    """ Yield (offset, length, title, {tag: value}) for each record of an open sdf. """
+    if fields is not None:
+        fields = set(fields)
+    offset = length = 0
+    title = None
+    data = {}
+    in_data = False
+    tag = None
+    value = []
+    for line in src:
+        length += len(line)
+        if title is None:
+            title = line.rstrip('\r\n')
+        elif line.startswith('$$$$'):
+            if tag is not None:
+                data[tag] = '\n'.join(value)
+            yield offset, length, title, data
+            offset += length
+            length = 0
+            title, data, in_data, tag, value = None, {}, False, None, []
+        elif not in_data:
+            in_data = line.startswith('M  END')
+        elif tag is not None:
+            if line.strip():
+                value.append(line.rstrip('\r\n'))
+            else:
+                data[tag] = '\n'.join(value)
+                tag = None
+        elif line.startswith('>'):
+            tag = _sdf_tag_name(line)
+            if fields is not None and tag not in fields:
+                tag = None
+            value = []
+    if title is not None and title.strip():
+        yield offset, length, title, data
+
+def scan_sdf(src, fields=None):
+    """ Yield (title, {tag: value}) for each record of an sdf file, looking only at the text:
+        no molecule is built (nor perceived), so this is the way to go when only the data
+        fields are needed. If fields is given, only these tags are kept.
+        Multi-line values are joined by newlines, like openbabel does.
+    """
+    with open_file(src, 'rb') as src:
+        for _, _, title, data in _scan_sdf_records(src, fields):
+            yield title, data
+
+def iter_sdf_records(src):
+    """ Yield the text of each record of an sdf file. """
+    with open_file(src, 'rb') as src:
+        record = []
+        for line in src:
+            record.append(line)
+            if line.startswith('$$$$'):
+                yield ''.join(record)
+                record = []
+        if ''.join(record).strip():
+            yield ''.join(record)
+
+def read_sdf(src):
+    """ pybel.readfile('sdf', src) that can also read compressed files (see open_file). """
+    import pybel
+    if not is_compressed(src):
+        return pybel.readfile('sdf', src)
+    return (pybel.readstring('sdf', record) for record in iter_sdf_records(src))
+
+class SDFIndex(object):
+    """ Byte offset and length of each record of an sdf file (plus titles and selected fields),
+        so that any molecule can be fetched with a single seek and workers can be handed
+        exact byte ranges. Use sdf_index to get one.
+    """
+
+    def __init__(self, src, offsets, lengths, titles, fields=None):
+        self.src = src
+        self.offsets = offsets
+        self.lengths = lengths
+        self.titles = titles
+        self.fields = fields if fields else {}
+        self._positions = None
+        self._sdf = None
+
+    @staticmethod
+    def build(src, fields=()):
+        """ Index src in one pass over its text. """
+        offsets = array.array('l')
+        lengths = array.array('l')
+        titles = []
+        values = dict((field, []) for field in fields)
+        with open_file(src, 'rb') as sdf:
+            for offset, length, title, data in _scan_sdf_records(sdf, fields):
+                offsets.append(offset)
+                lengths.append(length)
+                titles.append(title)
+                for field in fields:
+                    values[field].append(data.get(field, ''))
+        return SDFIndex(src,
+                        np.frombuffer(offsets, dtype=np.int_).copy(),
+                        np.frombuffer(lengths, dtype=np.int_).copy(),
+                        np.array(titles, dtype=str),
+                        dict((field, np.array(values[field], dtype=str)) for field in fields))
+
+    def save(self, dest):
+        arrays = dict(('field-' + field, values) for field, values in self.fields.items())
+        np.savez(dest, key=np.array(_file_key(self.src)), offsets=self.offsets, lengths=self.lengths,
+                 titles=self.titles, field_names=np.array(sorted(self.fields), dtype=str), **arrays)
+
+    @staticmethod
+    def load(src, index_file):
+        """ Read the index of src from index_file, None if it is stale. """
+        index = np.load(index_file)
+        if str(index['key']) != _file_key(src):
+            return None
+        fields = dict((field, index['field-' + field]) for field in index['field_names'].tolist())
+        return SDFIndex(src, index['offsets'], index['lengths'], index['titles'], fields)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def record(self, i):
+        """ The text of the i-th record. """
+        if self._sdf is None:
+            self._sdf = open_file(self.src, 'rb')
+        self._sdf.seek(self.offsets[i])
+        return self._sdf.read(self.lengths[i])
+
+    def records(self, start=0, end=None):
+        """ The texts of the records start..end-1, read at once. """
+        if end is None:
+            end = len(self)
+        if start >= end:
+            return []
+        first, last = self.offsets[start], self.offsets[end - 1] + self.lengths[end - 1]
+        if self._sdf is None:
+            self._sdf = open_file(self.src, 'rb')
+        self._sdf.seek(first)
+        text = self._sdf.read(last - first)
+        return [text[offset - first:offset - first + length]
+                for offset, length in zip(self.offsets[start:end], self.lengths[start:end])]
+
+    def position(self, title):
+        """ The index of the (first) record with this title, O(1) after the first call. """
+        if self._positions is None:
+            self._positions = {}
+            for i, record_title in enumerate(self.titles.tolist()):
+                self._positions.setdefault(record_title, i)
+        return self._positions[title]
+
+    def mol(self, i):
+        """ The i-th molecule as a pybel molecule. """
+        import pybel
+        return pybel.readstring('sdf', self.record(i))
+
+    def mol_by_title(self, title):
+        return self.mol(self.position(title))
+
+    def shards(self, num_shards):
+        """ Split the records in num_shards contiguous (start, end, first_byte, last_byte) ranges
+            of roughly the same size in bytes.
+        """
+        if not len(self):
+            return []
+        ends = np.cumsum(self.lengths)
+        cuts = np.searchsorted(ends, ends[-1] * np.arange(1, num_shards) / float(num_shards)) + 1
+        bounds = np.unique(np.concatenate(([0], np.minimum(cuts, len(self)), [len(self)]))).tolist()
+        return [(start, end, self.offsets[start], self.offsets[end - 1] + self.lengths[end - 1])
+                for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def close(self):
+        if self._sdf is not None:
+            self._sdf.close()
+            self._sdf = None
+
+def sdf_index(src, fields=(), index_file=None):
+    """ The SDFIndex of src, read from index_file (by default src + '.idx.npz') if it is up to
+        date and has all the requested fields, otherwise built and saved there.
+    """
+    if not index_file:
+        index_file = src + '.idx.npz'
+    if op.exists(index_file):
+        index = SDFIndex.load(src, index_file)
+        if index is not None and all(field in index.fields for field in fields):
+            return index
+    index = SDFIndex.build(src, fields)
+    try:
+        index.save(index_file)
+    except (IOError, OSError):
+        pass
+    return index
+
 def data_fields(directory, sdf_file):
     """This function returns the list of fields (other than atom 
     coordinates) present in an .sdf file"""
-    mols = pybel.readfile("sdf", op.join(directory, sdf_file))
     fields = []
-    for mol in mols:
-        field = mol.data.keys()
-        for item in field:
+    for _, data in scan_sdf(op.join(directory, sdf_file)):
+        for item in data:
             if item not in fields and item not in ["OpenBabel Symmetry Classes"]:
                 fields.append(item)
     return fields        
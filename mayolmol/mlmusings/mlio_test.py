@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+import unittest
+import os.path as op
+import shutil
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+from mayolmol.mlmusings import mlio
+
+TDD = op.join(op.split(__file__)[0], "..", "data")
+
+ARFF = """@relation test
+
+@attribute f-0 real
+@attribute f-1 real
+@attribute class {a,b}
+@data
+1,2.5,a
+3,?,b
+
+-1,0,b
+"""
+
+SPARSE_ARFF = """@relation sparse
+
+@attribute f-0 real
+@attribute f-1 real
+@attribute f-2 real
+@attribute class {a,b}
+@data
+{0 1,2 3.5,3 b}
+{1 2}
+{}
+"""
+
+class ArffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.arff = op.join(self.tmp, 'test.arff')
+        with open(self.arff, 'w') as dest:
+            dest.write(ARFF)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_arff(self):
+        name, attributes, classes, x, y = mlio.load_arff(self.arff)
+        self.assertEqual('test', name)
+        self.assertEqual(['f-0', 'f-1', 'class'], attributes)
+        self.assertEqual({'a': 0, 'b': 1}, classes)
+        self.assertEqual((3, 2), x.shape)
+        self.assertTrue(np.isnan(x[1, 1]))
+        self.assertEqual([0, 1, 1], list(y))
+
+    def test_iter_arff(self):
+        blocks = list(mlio.iter_arff(self.arff, chunk_size=2, dtype=np.float32))
+        self.assertEqual([2, 1], [len(x) for x, _ in blocks])
+        self.assertEqual(np.float32, blocks[0][0].dtype)
+        _, _, _, x, y = mlio.load_arff(self.arff)
+        np.testing.assert_array_equal(x, np.vstack([block for block, _ in blocks]))
+        np.testing.assert_array_equal(y, np.concatenate([block for _, block in blocks]))
+
+    def test_save_arff_roundtrip(self):
+        x = np.array([[7, 0.5, 1, 0], [8, np.nan, 0, 1]])
+        y = np.array([0.0, np.nan])
+        dest = op.join(self.tmp, 'saved.arff')
+        mlio.save_arff(x, y, dest)
+        with open(dest) as src:
+            self.assertEqual(['7,0.5,1,0,0.0', '8,?,0,1,?'], src.read().splitlines()[-2:])
+        _, _, _, x2, y2 = mlio.load_arff(dest, rename_classes=False)
+        np.testing.assert_array_equal(x, x2)
+        np.testing.assert_array_equal(y, y2)
+        #Bits follow the format too
+        mlio.save_arff(x, y, dest, format='%.3f')
+        with open(dest) as src:
+            self.assertEqual('7.000,0.500,1.000,0.000,0.0', src.read().splitlines()[-2])
+
+    def test_arff_to_npy(self):
+        _, _, _, expected, _ = mlio.load_arff(self.arff)
+        x = mlio.arff_to_npy(self.arff, op.join(self.tmp, 'x.npy'), chunk_size=2)
+        self.assertTrue(isinstance(x, np.memmap))
+        np.testing.assert_array_equal(expected, x)
+
+    def test_load_arff_parallel(self):
+        x = np.random.RandomState(0).rand(500, 3)
+        dest = op.join(self.tmp, 'big.arff')
+        mlio.save_arff(x, np.arange(500) % 2, dest, classes=[0, 1])
+        expected = mlio.load_arff(dest, rename_classes=False)
+        name, attributes, classes, x, y = mlio.load_arff_parallel(dest, rename_classes=False, processes=3)
+        self.assertEqual(expected[:3], (name, attributes, classes))
+        np.testing.assert_array_equal(expected[3], x)
+        np.testing.assert_array_equal(expected[4], y)
+
+    def test_merge_arffs(self):
+        ids = np.arange(6)[:, np.newaxis]
+        x1, x2, x3 = np.random.RandomState(0).randint(0, 9, (3, 6, 2))
+        y = np.arange(6) % 2
+        first, second, third = [op.join(self.tmp, name + '.arff') for name in ('first', 'second', 'third')]
+        mlio.save_arff(np.hstack((ids, x1)), y, first, classes=[0, 1])
+        shuffled = [5, 2, 0, 1, 3]  #The instance 4 is missing
+        mlio.save_arff(np.hstack((ids, x2))[shuffled], y[shuffled], second, classes=[0, 1])
+        mlio.save_arff(np.hstack((ids, x3)), y, third, classes=[0, 1])
+        dest = op.join(self.tmp, 'merged.arff')
+        self.assertEqual(5, mlio.merge_arffs(dest, [first, second, third]))
+        name, attributes, _, x, merged_y = mlio.load_arff(dest, rename_classes=False)
+        self.assertEqual('first', name)
+        self.assertEqual(8, len(attributes))
+        kept = [0, 1, 2, 3, 5]
+        np.testing.assert_array_equal(np.hstack((ids, x1, x2, x3))[kept], x)
+        np.testing.assert_array_equal(y[kept], merged_y)
+
+    def test_compressed_arff(self):
+        _, _, _, x, y = mlio.load_arff(self.arff)
+        for extension in ('.gz', '.bz2'):
+            dest = op.join(self.tmp, 'compressed.arff' + extension)
+            mlio.save_arff(x, y, dest)
+            with open(dest, 'rb') as src:
+                self.assertFalse(src.read().startswith('@relation'))
+            _, _, _, x2, y2 = mlio.load_arff(dest, rename_classes=False)
+            np.testing.assert_array_equal(x, x2)
+            np.testing.assert_array_equal(y, y2)
+
+    def test_sparse_arff(self):
+        sparse = op.join(self.tmp, 'sparse.arff')
+        with open(sparse, 'w') as dest:
+            dest.write(SPARSE_ARFF)
+        _, attributes, classes, x, y = mlio.load_sparse_arff(sparse)
+        self.assertTrue(sp.isspmatrix_csr(x))
+        np.testing.assert_array_equal([[1, 0, 3.5], [0, 2, 0], [0, 0, 0]], x.toarray())
+        self.assertEqual([1, 0, 0], list(y))
+        dest = op.join(self.tmp, 'saved.arff')
+        mlio.save_sparse_arff(x, y, dest, feature_names=attributes[:-1], classes=[0, 1])
+        _, _, _, x2, y2 = mlio.load_sparse_arff(dest, rename_classes=False)
+        np.testing.assert_array_equal(x.toarray(), x2.toarray())
+        np.testing.assert_array_equal(y, y2)
+
+    def test_arff_cache(self):
+        expected = mlio.load_arff(self.arff)
+        self.assertEqual(None, mlio.read_arff_cache(self.arff))
+        mlio.load_arff(self.arff, cache=True)
+        name, attributes, classes, x, y = mlio.load_arff(self.arff, cache=True)
+        self.assertTrue(isinstance(x, np.memmap))
+        self.assertEqual(expected[:3], (name, attributes, classes))
+        np.testing.assert_array_equal(expected[3], x)
+        np.testing.assert_array_equal(expected[4], y)
+        #A modified arff invalidates the sidecar
+        with open(self.arff, 'a') as dest:
+            dest.write('5,5,a\n')
+        self.assertEqual(None, mlio.read_arff_cache(self.arff))
+        self.assertEqual(4, len(mlio.load_arff(self.arff, cache=True)[3]))
+
+    def test_libsvm(self):
+        x = sp.csr_matrix(np.array([[0, 1.5, 0, 2], [0, 0, 0, 0], [3, 0, 0, 0]]))
+        y = np.array([1, -1, 1])
+        dest = op.join(self.tmp, 'test.libsvm')
+        mlio.save_libsvm(x, y, dest)
+        with open(dest) as src:
+            self.assertEqual('1 2:1.5 4:2', src.readline().strip())
+        x2, y2 = mlio.load_libsvm(dest)
+        np.testing.assert_array_equal(x.toarray(), x2.toarray())
+        np.testing.assert_array_equal(y, y2)
+        self.assertEqual((3, 6), mlio.load_libsvm(dest, num_features=6, zero_based=True)[0].shape)
+
+    def test_libsvm_matrix(self):
+        dest = op.join(self.tmp, 'test.libsvm-kernel')
+        with open(dest, 'w') as out:
+            out.write('1 0:1 1:1 2:0.5\n0 0:2 1:0.5 2:1\n')
+        K, y, serials = mlio.load_libsvm_matrix(dest)
+        np.testing.assert_array_equal([[1, 0.5], [0.5, 1]], K)
+        np.testing.assert_array_equal([1, 0], y)
+        np.testing.assert_array_equal([1, 2], serials)
+
+class SDFTest(unittest.TestCase):
+
+    def test_scan_sdf(self):
+        records = list(mlio.scan_sdf(op.join(TDD, "2mols_unique.sdf")))
+        self.assertEqual(['5275518', '5275513', '9082136'], [title for title, _ in records])
+        self.assertEqual('ChemBridge', records[0][1]['Supplier'])
+        self.assertEqual(9, len(records[0][1]))
+        tpsas = mlio.scan_sdf(op.join(TDD, "2mols_unique.sdf"), fields=['tPSA'])
+        self.assertEqual([{'tPSA': '1.093800000000000e+002'}, {'tPSA': '1.055700000000000e+002'},
+                          {'tPSA': '4.201000000000001e+001'}], [data for _, data in tpsas])
+
+    def test_sdf_index(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            sdf = op.join(tmp, 'test.sdf')
+            shutil.copy(op.join(TDD, "3mols_dupl.sdf"), sdf)
+            index = mlio.sdf_index(sdf, fields=['tPSA'])
+            self.assertTrue(op.exists(sdf + '.idx.npz'))
+            index = mlio.sdf_index(sdf, fields=['tPSA'])
+            self.assertEqual(4, len(index))
+            self.assertEqual('4.201000000000001e+001', index.fields['tPSA'][2])
+            self.assertEqual(1, index.position('5275513'))
+            self.assertTrue(index.record(1).startswith('5275513'))
+            with open(sdf) as src:
+                self.assertEqual(src.read(), ''.join(index.records()))
+            shards = index.shards(2)
+            self.assertEqual([(0, 2), (2, 4)], [shard[:2] for shard in shards])
+            self.assertEqual(index.offsets[2], shards[1][2])
+            index.close()
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_compressed_sdf(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            sdf = op.join(tmp, 'test.sdf.gz')
+            with open(op.join(TDD, "2mols_unique.sdf"), 'rb') as src:
+                with mlio.open_file(sdf, 'w') as dest:
+                    dest.write(src.read())
+            self.assertEqual(list(mlio.scan_sdf(op.join(TDD, "2mols_unique.sdf"))), list(mlio.scan_sdf(sdf)))
+            self.assertEqual(3, len(list(mlio.iter_sdf_records(sdf))))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_data_fields(self):
+        self.assertEqual(set(['ID', 'Supplier', 'clogP', 'RB', 'tPSA', 'Hacc', 'Hdon', 'LogSw', 'Group', 'Core']),
+                         set(mlio.data_fields(TDD, "3mols_dupl.sdf")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,20 +1,456 @@
 # -*- coding: utf-8 -*-
 """ Some methods for working with neighborhoods of data points """
+import heapq
+import multiprocessing
 import os
+import os.path as op
+import time
 import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+from mayolmol.mlmusings import mlio
 
-def nns(x, k=5):
+#Up to this dimensionality "auto" uses a kd-tree instead of brute force
+KDTREE_MAX_DIMENSIONS = 10
+
+def _top_k(distances, indices, k):
+    """ The (unsorted) k smallest distances of each row and their indices. """
+    if distances.shape[1] <= k:
+        return distances, indices
+    rows = np.arange(len(distances))[:, np.newaxis]
+    smallest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return distances[rows, smallest], indices[rows, smallest]
+
+def _nns_block(query, query_start, x, x_sqnorms, k, tile_size, reverse=False):
+    """ kNN of the rows query (that are x[query_start:query_start + len(query)]) among the rows of x,
+        visiting x in tiles of tile_size rows (last to first if reverse).
+        Returns the sorted indices and squared distances.
+    """
+    num_queries = len(query)
+    rows = np.arange(num_queries)
+    query_sqnorms = (query ** 2).sum(1)
+    best_d = np.empty((num_queries, 0), dtype=query.dtype)
+    best_i = np.empty((num_queries, 0), dtype=np.int32)
+    starts = xrange(0, len(x), tile_size)
+    for start in (reversed(starts) if reverse else starts):
+        tile = np.asarray(x[start:start + tile_size], dtype=query.dtype)
+        distances = query_sqnorms[:, np.newaxis] + x_sqnorms[np.newaxis, start:start + len(tile)]
+        distances -= 2 * np.dot(query, tile.T)
+        #An example is not its own neighbor
+        selves = rows + query_start - start
+        in_tile = (selves >= 0) & (selves < len(tile))
+        distances[rows[in_tile], selves[in_tile]] = np.PINF
+        indices = np.empty(distances.shape, dtype=np.int32)
+        indices[:] = np.arange(start, start + len(tile), dtype=np.int32)
+        best_d, best_i = _top_k(np.hstack((best_d, distances)), np.hstack((best_i, indices)), k)
+    order = np.argsort(best_d, axis=1, kind='mergesort')
+    return best_i[rows[:, np.newaxis], order], np.maximum(best_d[rows[:, np.newaxis], order], 0)
+
+def _kdtree_nns(x, k):
+    """ kNN (excluding the example itself) by querying a kd-tree for k + 1 neighbors. """
+    distances, neighbors = cKDTree(x).query(x, k + 1)
+    #Usually the example is its first neighbor, but with duplicates it can be anywhere (or nowhere)
+    keep = neighbors != np.arange(len(x))[:, np.newaxis]
+    keep[keep.all(axis=1), k] = False
+    return neighbors[keep].reshape(len(x), k).astype(np.int32), distances[keep].reshape(len(x), k)
+
+def nns(x, k=5, tile_size=1024, return_distances=False, algorithm='auto'):
     """NNs under Euclidean distance
-       Note that by default we are using an stable sort to get the points sorted,
-       so we are subject to order artifacts in the original data (like having
-       the points sorted by class). To avoid them, pre-shuffle x.
+       Returns an (examples x k) int32 array with the indices of the neighbors of each example,
+       sorted by distance (and, if requested, the array of distances).
+       algorithm can be:
+         - "brute": distances are computed blockwise as |a|^2 + |b|^2 - 2ab, so the heavy lifting
+           is done by BLAS and memory is bounded by tile_size^2 distances.
+         - "kdtree": O(n log n) search on a kd-tree, only worth it for low dimensional data.
+         - "auto": kdtree up to KDTREE_MAX_DIMENSIONS features, brute otherwise.
+       Note that ties are broken arbitrarily, so we are subject to order artifacts in
+       the original data (like having the points sorted by class). To avoid them, pre-shuffle x.
+    """
+    if x.dtype.kind != 'f':
+        x = x.astype(np.float64)
+    k = min(k, len(x) - 1)
+    if algorithm == 'auto':
+        algorithm = 'kdtree' if x.shape[1] <= KDTREE_MAX_DIMENSIONS else 'brute'
+    if algorithm == 'kdtree':
+        neighbors, distances = _kdtree_nns(x, k)
+        if return_distances:
+            return neighbors, distances
+        return neighbors
+    if algorithm != 'brute':
+        raise Exception('Unknown kNN algorithm %s' % algorithm)
+    sqnorms = (x ** 2).sum(1)
+    neighbors = np.empty((len(x), k), dtype=np.int32)
+    distances = np.empty((len(x), k), dtype=x.dtype)
+    for start in xrange(0, len(x), tile_size):
+        end = start + tile_size
+        neighbors[start:end], distances[start:end] = _nns_block(x[start:end], start, x, sqnorms, k, tile_size)
+    if return_distances:
+        return neighbors, np.sqrt(distances)
+    return neighbors
+
+def nns_out_of_core(x, dest, distances_dest=None, k=5, query_size=4096, tile_size=4096, verbose=False):
+    """ Like nns with the brute algorithm, for feature matrices that do not fit in RAM.
+        x can be a np.memmap (or any array), the path to a .npy file or the path to an arff.
+        An arff is read through its binary sidecar if there is one (see mlio.load_arff), else
+        its features are first streamed to a .npy next to dest (see mlio.arff_to_npy).
+        Blocks of query_size examples are kept in memory while x is streamed in tiles of
+        tile_size rows, alternating the direction of the sweep so that the last tiles read
+        are still in the page cache for the next block.
+        The neighbors are written to an int32 .npy file in dest (and the distances to a
+        float .npy in distances_dest, if given); the memory-mapped arrays are returned.
+    """
+    if isinstance(x, basestring):
+        if x.endswith('.npy'):
+            x = np.load(x, mmap_mode='r')
+        else:
+            #The features are the same however the classes were renamed
+            cached = (mlio.read_arff_cache(x, rename_classes=True, mmap_mode='r') or
+                      mlio.read_arff_cache(x, rename_classes=False, mmap_mode='r'))
+            if cached:
+                x = cached[3]
+            else:
+                x = mlio.arff_to_npy(x, op.splitext(dest)[0] + '-features.npy', query_size)
+    dtype = x.dtype if x.dtype.kind == 'f' else np.float64
+    k = min(k, len(x) - 1)
+    sqnorms = np.empty(len(x), dtype=dtype)
+    for start in xrange(0, len(x), tile_size):
+        sqnorms[start:start + tile_size] = (np.asarray(x[start:start + tile_size], dtype=dtype) ** 2).sum(1)
+    neighbors = np.lib.format.open_memmap(dest, mode='w+', dtype=np.int32, shape=(len(x), k))
+    distances = None
+    if distances_dest:
+        distances = np.lib.format.open_memmap(distances_dest, mode='w+', dtype=dtype, shape=(len(x), k))
+    for block, start in enumerate(xrange(0, len(x), query_size)):
+        query = np.asarray(x[start:start + query_size], dtype=dtype)
+        block_neighbors, block_distances = _nns_block(query, start, x, sqnorms, k, tile_size, reverse=block % 2)
+        neighbors[start:start + len(query)] = block_neighbors
+        if distances is not None:
+            distances[start:start + len(query)] = np.sqrt(block_distances)
+        if verbose:
+            print '%d of %d examples done' % (start + len(query), len(x))
+    neighbors.flush()
+    if distances is not None:
+        distances.flush()
+        return neighbors, distances
+    return neighbors
+
+def pack_fingerprints(x, chunk_size=4096):
+    """ Packs the bits of a binary fingerprints matrix (dense or scipy sparse, any non-zero is an on bit)
+        into an (examples x words) uint64 array, 64 features per word.
+        Already packed fingerprints are returned as they are.
+    """
+    if isinstance(x, np.ndarray) and x.dtype == np.uint64:
+        return x
+    num_words = (x.shape[1] + 63) // 64
+    packed = np.zeros((x.shape[0], num_words * 8), dtype=np.uint8)
+    for start in xrange(0, x.shape[0], chunk_size):
+        chunk = x[start:start + chunk_size]
+        if sp.issparse(chunk):
+            chunk = chunk.toarray()
+        bits = np.packbits(np.asarray(chunk) != 0, axis=1)
+        packed[start:start + len(bits), :bits.shape[1]] = bits
+    return packed.view(np.uint64)
+
+def popcount(words):
+    """ Number of on bits in each element of an uint64 array (SWAR, as in "Hacker's Delight"). """
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+def _unpack(packed):
+    return np.unpackbits(packed.view(np.uint8), axis=1).astype(np.float32)
+
+def tanimoto(query, fps, query_counts=None, fps_counts=None):
+    """ Tanimoto (Jaccard) similarities between the rows of two packed fingerprint matrices.
+        Two empty fingerprints have similarity 0.
+        The bit counts come from popcount; the intersections are computed by BLAS over the
+        unpacked blocks, which is (much) faster in numpy than and-ing and popcounting words
+        (float32 is exact for counts under 2^24).
+    """
+    if query_counts is None:
+        query_counts = popcount(query).sum(1)
+    if fps_counts is None:
+        fps_counts = popcount(fps).sum(1)
+    common = np.dot(_unpack(query), _unpack(fps).T).astype(np.float64)
+    union = query_counts[:, np.newaxis] + fps_counts[np.newaxis, :] - common
+    return common / np.maximum(union, 1)
+
+def tanimoto_nns(x, k=5, tile_size=1024, return_similarities=False):
+    """NNs under Tanimoto similarity for binary fingerprints.
+       x can be a binary matrix (dense or sparse) or an already packed one (see pack_fingerprints).
+       Returns an (examples x k) int32 array with the indices of the neighbors of each example,
+       sorted by decreasing similarity (and, if requested, the array of similarities).
+       Fingerprints are kept packed (64x less memory than float rows), only a pair of
+       tiles of tile_size rows is unpacked at a time.
     """
-    nns = []
-    for ex in range(x.shape[0]): #At least lets not keep the whole ne x ne distance matrix in memory
-        distances = ((x - x[ex,:]) ** 2).sum(1) #Oh well, n² distance computations, we could do half using heaps...
-        distances[ex] = np.PINF
-        nns.append(np.argsort(distances)[0:k])
-    return nns
+    x = pack_fingerprints(x)
+    k = min(k, len(x) - 1)
+    counts = popcount(x).sum(1)
+    neighbors = np.empty((len(x), k), dtype=np.int32)
+    similarities = np.empty((len(x), k))
+    for qstart in xrange(0, len(x), tile_size):
+        query = x[qstart:qstart + tile_size]
+        rows = np.arange(len(query))
+        best_d = np.empty((len(query), 0))
+        best_i = np.empty((len(query), 0), dtype=np.int32)
+        for start in xrange(0, len(x), tile_size):
+            tile = x[start:start + tile_size]
+            #Work with dissimilarities to reuse the kNN machinery
+            distances = 1 - tanimoto(query, tile, counts[qstart:qstart + len(query)], counts[start:start + len(tile)])
+            selves = rows + qstart - start
+            in_tile = (selves >= 0) & (selves < len(tile))
+            distances[rows[in_tile], selves[in_tile]] = np.PINF
+            indices = np.empty(distances.shape, dtype=np.int32)
+            indices[:] = np.arange(start, start + len(tile), dtype=np.int32)
+            best_d, best_i = _top_k(np.hstack((best_d, distances)), np.hstack((best_i, indices)), k)
+        order = np.argsort(best_d, axis=1, kind='mergesort')
+        neighbors[qstart:qstart + len(query)] = best_i[rows[:, np.newaxis], order]
+        similarities[qstart:qstart + len(query)] = 1 - best_d[rows[:, np.newaxis], order]
+    if return_similarities:
+        return neighbors, similarities
+    return neighbors
+
+class KNNGraph(object):
+    """ A kNN graph: the neighbors of each example as an (examples x k) int32 array,
+        sorted by distance, and optionally their float32 distances.
+        It can be used wherever a list of neighbor arrays was used.
+    """
+    def __init__(self, indices, distances=None):
+        self.indices = np.ascontiguousarray(indices, dtype=np.int32)
+        if self.indices.ndim == 1:
+            self.indices = self.indices.reshape(-1, 1 if len(self.indices) else 0)
+        self.distances = None if distances is None else np.ascontiguousarray(distances, dtype=np.float32)
+
+    @property
+    def k(self):
+        return self.indices.shape[1]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, example):
+        return self.indices[example]
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def edges(self):
+        """ The (source, target) arrays of the directed edges example -> neighbor. """
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.k), self.indices.ravel()
+
+    def to_csr(self):
+        """ The graph as a (examples x examples) CSR matrix, with the distances as values if we have them. """
+        n = len(self)
+        data = np.ones(self.indices.size, dtype=np.float32) if self.distances is None else self.distances.ravel()
+        indptr = np.arange(0, n * self.k + 1, self.k, dtype=np.int32)
+        return sp.csr_matrix((data, self.indices.ravel(), indptr), shape=(n, n))
+
+    def bad_edges(self, y):
+        """ An (examples x k) boolean mask, true where the neighbor is of a different class. """
+        y = np.asarray(y)
+        return y[self.indices] != y[:, np.newaxis]
+
+    def hubness(self):
+        """ How many times each example is the neighbor of another. """
+        return np.bincount(self.indices.ravel(), minlength=len(self))
+
+    def bad_neighborhoodness(self, y):
+        """ How many times each example is the neighbor of an example of another class. """
+        return np.bincount(self.indices[self.bad_edges(y)], minlength=len(self))
+
+    def good_neighborhoodness(self, y):
+        """ How many times each example is the neighbor of an example of its same class. """
+        return np.bincount(self.indices[~self.bad_edges(y)], minlength=len(self))
+
+    def error(self, y, k=None):
+        """ Leave-one-out error of the k-NN majority vote (ties count as errors). """
+        if not k:
+            k = self.k
+        right = (~self.bad_edges(y)[:, :k]).sum(1)
+        return float((right <= k / 2.0).mean())
+
+    def accuracy_curve(self, y, weighted=False, epsilon=1e-9):
+        """ Leave-one-out k-NN accuracies for k = 1..self.k in one pass (position k - 1 is k).
+            An example is right if more than half of the votes are for its class,
+            as in error. If weighted, each neighbor votes with 1 / (distance + epsilon).
+        """
+        if weighted:
+            if self.distances is None:
+                raise Exception('Weighted voting needs a graph with distances')
+            votes = 1.0 / (self.distances.astype(np.float64) + epsilon)
+        else:
+            votes = np.ones(self.indices.shape)
+        right = np.cumsum(votes * ~self.bad_edges(y), axis=1)
+        return (right > np.cumsum(votes, axis=1) / 2.0).mean(0)
+
+def knn_graph(x, k=5, metric='euclidean', **kwargs):
+    """ The KNNGraph of x under "euclidean" (see nns) or "tanimoto" (see tanimoto_nns). """
+    if metric == 'tanimoto':
+        indices, similarities = tanimoto_nns(x, k, return_similarities=True, **kwargs)
+        return KNNGraph(indices, 1 - similarities)
+    return KNNGraph(*nns(x, k, return_distances=True, **kwargs))
+
+class _LSHIndex(object):
+    """ Base of the LSH indices: num_tables hash tables (dicts from bucket key to example ids)
+        plus the stored examples to rerank the candidates exactly.
+        Subclasses provide _hash (the (examples x num_tables) keys and the stored form of
+        a block of examples) and _distances (between two blocks of stored examples).
+    """
+    def __init__(self, num_tables, hashes_per_table, seed):
+        self.num_tables = num_tables
+        self.rng = np.random.RandomState(seed)
+        #Odd multipliers to combine the hashes of a table into one key
+        self._multipliers = self.rng.randint(1, 2 ** 62, size=hashes_per_table).astype(np.uint64) * 2 + 1
+        self.tables = [{} for _ in range(num_tables)]
+        self._chunks = []
+        self._data = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def data(self):
+        if self._chunks:
+            self._data = np.vstack(([self._data] if self._data is not None else []) + self._chunks)
+            self._chunks = []
+        return self._data
+
+    def _combine(self, hashes):
+        """ Combines the (examples x num_tables x hashes) int hashes into one uint64 key per table. """
+        return (hashes.astype(np.uint64) * self._multipliers).sum(-1)
+
+    def add(self, x, chunk_size=1024):
+        """ Adds the examples in x, returning their ids. """
+        first = self.size
+        for start in xrange(0, x.shape[0], chunk_size):
+            keys, stored = self._hash(x[start:start + chunk_size])
+            for example, example_keys in enumerate(keys.tolist()):
+                for table, key in zip(self.tables, example_keys):
+                    table.setdefault(key, []).append(self.size + example)
+            self._chunks.append(stored)
+            self.size += len(stored)
+        return np.arange(first, self.size)
+
+    def candidates(self, keys):
+        """ The ids of the examples sharing a bucket with a query in some table. """
+        candidates = set()
+        for table, key in zip(self.tables, keys):
+            candidates.update(table.get(key, ()))
+        return np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+
+    def query(self, x, k=5, chunk_size=1024):
+        """ Approximate kNN of the examples in x among the indexed ones.
+            Returns (examples x k) arrays of ids and distances, padded with -1 / inf when
+            there are less than k candidates. Examples already in the index find themselves.
+        """
+        data = self.data
+        neighbors = np.empty((x.shape[0], k), dtype=np.int32)
+        distances = np.empty((x.shape[0], k))
+        for start in xrange(0, x.shape[0], chunk_size):
+            keys, stored = self._hash(x[start:start + chunk_size])
+            for example, example_keys in enumerate(keys.tolist()):
+                candidates = self.candidates(example_keys)
+                found = min(k, len(candidates))
+                candidate_distances = self._distances(stored[example:example + 1], data[candidates])[0]
+                best = np.argsort(candidate_distances, kind='mergesort')[:found]
+                neighbors[start + example, :found] = candidates[best]
+                neighbors[start + example, found:] = -1
+                distances[start + example, :found] = candidate_distances[best]
+                distances[start + example, found:] = np.PINF
+        return neighbors, distances
+
+    def exact_query(self, x, k=5, tile_size=4096):
+        """ Exact kNN of the examples in x among the indexed ones, by brute force. """
+        _, query = self._hash(x)
+        data = self.data
+        rows = np.arange(len(query))[:, np.newaxis]
+        best_d = np.empty((len(query), 0))
+        best_i = np.empty((len(query), 0), dtype=np.int32)
+        for start in xrange(0, len(data), tile_size):
+            distances = self._distances(query, data[start:start + tile_size])
+            indices = np.empty(distances.shape, dtype=np.int32)
+            indices[:] = np.arange(start, start + distances.shape[1], dtype=np.int32)
+            best_d, best_i = _top_k(np.hstack((best_d, distances)), np.hstack((best_i, indices)), k)
+        order = np.argsort(best_d, axis=1, kind='mergesort')
+        return best_i[rows, order], best_d[rows, order]
+
+class MinHashLSH(_LSHIndex):
+    """ LSH for binary fingerprints (dense or sparse) under Jaccard / Tanimoto.
+        Each of the num_tables tables hashes the band of rows_per_table minhashes of an example,
+        so two fingerprints with Tanimoto s share a bucket in a table with probability s^rows_per_table.
+        More tables means more recall, more rows per table means less candidates (speed).
+        Fingerprints are stored packed; distances are 1 - Tanimoto.
+    """
+    PRIME = 2 ** 31 - 1
+
+    def __init__(self, num_tables=16, rows_per_table=4, seed=0):
+        _LSHIndex.__init__(self, num_tables, rows_per_table, seed)
+        self.rows_per_table = rows_per_table
+        num_hashes = num_tables * rows_per_table
+        self.a = self.rng.randint(1, self.PRIME, size=num_hashes).astype(np.int64)
+        self.b = self.rng.randint(0, self.PRIME, size=num_hashes).astype(np.int64)
+
+    def minhashes(self, x):
+        """ The (examples x num_hashes) minhash signatures of the on bits in x. """
+        x = sp.csr_matrix(x)
+        hashes = (self.a[:, np.newaxis] * x.indices[np.newaxis, :] + self.b[:, np.newaxis]) % self.PRIME
+        #Pad so that reduceat can start empty rows at the end; the last row is reduced up to the
+        #end of the array, so the padding must not be smaller than any hash
+        hashes = np.hstack((hashes, np.full((len(self.a), 1), self.PRIME, dtype=hashes.dtype)))
+        signatures = np.minimum.reduceat(hashes, x.indptr[:-1], axis=1).T
+        signatures[np.diff(x.indptr) == 0] = self.PRIME
+        return signatures
+
+    def _hash(self, x):
+        signatures = self.minhashes(x).reshape(x.shape[0], self.num_tables, self.rows_per_table)
+        return self._combine(signatures), pack_fingerprints(x)
+
+    def _distances(self, query, fps):
+        return 1 - tanimoto(query, fps)
+
+class RandomProjectionLSH(_LSHIndex):
+    """ LSH for real valued descriptors under Euclidean distance (p-stable random projections).
+        Each table hashes an example to floor((a.x + b) / bucket_width) for projections_per_table
+        gaussian directions a. More tables means more recall, more projections per table or narrower
+        buckets means less candidates (speed). bucket_width is in the units of the data.
+    """
+    def __init__(self, dimensionality, num_tables=8, projections_per_table=8, bucket_width=4.0, seed=0):
+        _LSHIndex.__init__(self, num_tables, projections_per_table, seed)
+        self.projections_per_table = projections_per_table
+        self.bucket_width = bucket_width
+        num_projections = num_tables * projections_per_table
+        self.projections = self.rng.normal(size=(dimensionality, num_projections))
+        self.offsets = self.rng.uniform(0, bucket_width, size=num_projections)
+
+    def _hash(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        hashes = np.floor((np.dot(x, self.projections) + self.offsets) / self.bucket_width).astype(np.int64)
+        return self._combine(hashes.reshape(len(x), self.num_tables, self.projections_per_table)), x
+
+    def _distances(self, query, x):
+        distances = (query ** 2).sum(1)[:, np.newaxis] + (x ** 2).sum(1)[np.newaxis, :] - 2 * np.dot(query, x.T)
+        return np.sqrt(np.maximum(distances, 0))
+
+def lsh_recall(index, x, k=10, sample_size=1000, seed=0):
+    """ Compares the approximate kNN of a sample of the examples in x with the exact ones
+        (x is usually what has been indexed). Returns a dict with the mean recall@k, the mean
+        number of candidates reranked per query and the approximate and exact query times.
+    """
+    sample = np.random.RandomState(seed).permutation(x.shape[0])[:sample_size]
+    sample.sort()
+    queries = x[sample]
+    start = time.time()
+    approximate, _ = index.query(queries, k)
+    approximate_time = time.time() - start
+    start = time.time()
+    exact, _ = index.exact_query(queries, k)
+    exact_time = time.time() - start
+    keys, _ = index._hash(queries)
+    recall = np.mean([len(np.intersect1d(a, e)) / float(len(e)) for a, e in zip(approximate, exact)])
+    candidates = np.mean([len(index.candidates(example_keys)) for example_keys in keys.tolist()])
+    return {'recall': recall, 'candidates': candidates,
+            'approximate_time': approximate_time, 'exact_time': exact_time}
 
 def count_holding(collection, *predicates):
     counts = [0] * len(predicates)
@@ -25,20 +461,22 @@ def count_holding(collection, *predicates):
     return tuple(counts)
 
 def nn_error(nns, y, k=None):
-    if not k:
-        k = len(nns[0])
-    error = 0.0
-    for i, nn in enumerate(nns):
-        right, = count_holding(nn[:k], lambda a: y[a] == y[i])
-        if right <= k / 2.0:
-            error += 1
-    return error / len(nns)
+    return KNNGraph(nns).error(y, k)
 
 def nn_acc(nns, y, k=None):
     return 1.0 - nn_error(nns, y, k)
 
+def nn_acc_curve(x, y, k_max=20, weighted=False, metric='euclidean'):
+    """ kNN accuracies for all k <= k_max from a single neighbor search (see KNNGraph.accuracy_curve).
+        Returns the k values and their accuracies.
+    """
+    accuracies = knn_graph(x, k_max, metric).accuracy_curve(y, weighted)
+    return np.arange(1, len(accuracies) + 1), accuracies
+
 def vizrank(x, y, k=10):
-    """ Naive vizrank implementation """
+    """ Naive vizrank implementation
+        The projections are 2D, so nns goes through the kd-tree.
+    """
     _, nf = x.shape
     scores = []
     for i in range(nf):
@@ -46,21 +484,58 @@ def vizrank(x, y, k=10):
             scores.append([nn_acc(nns(x[:, (i, j)], k), y), i, j])
     return sorted(scores, key=lambda a: a[0], reverse=True)
 
+#Data shared by the parallel vizrank workers, set once per process by the pool initializer
+_vizrank_data = {}
+
+def _init_vizrank_worker(x, shape, y, k):
+    _vizrank_data['x'] = np.frombuffer(x).reshape(shape)
+    _vizrank_data['y'] = np.frombuffer(y)
+    _vizrank_data['k'] = k
+
+def _vizrank_pairs(pairs):
+    x, y, k = _vizrank_data['x'], _vizrank_data['y'], _vizrank_data['k']
+    return [[nn_acc(nns(x[:, (i, j)], k), y), i, j] for i, j in pairs]
+
+def parallel_vizrank(x, y, k=10, top=None, processes=None, batch_size=16, verbose=True):
+    """ vizrank with the feature pairs distributed in batches over a pool of processes.
+        x and y are copied once to shared memory, so tasks are just lists of pairs.
+        If top is given, only the best top scores are kept (in a heap) and returned.
+    """
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    ne, nf = x.shape
+    shared_x = multiprocessing.RawArray('d', ne * nf)
+    np.frombuffer(shared_x).reshape(ne, nf)[:] = x
+    shared_y = multiprocessing.RawArray('d', ne)
+    np.frombuffer(shared_y)[:] = y
+    pairs = [(i, j) for i in range(nf) for j in range(i + 1, nf)]
+    batches = [pairs[start:start + batch_size] for start in xrange(0, len(pairs), batch_size)]
+    scores = []
+    done = 0
+    pool = multiprocessing.Pool(processes, initializer=_init_vizrank_worker,
+                                initargs=(shared_x, (ne, nf), shared_y, k))
+    try:
+        for batch_scores in pool.imap_unordered(_vizrank_pairs, batches):
+            for score in batch_scores:
+                if top is None:
+                    scores.append(score)
+                elif len(scores) < top:
+                    heapq.heappush(scores, score)
+                else:
+                    heapq.heappushpop(scores, score)
+            done += len(batch_scores)
+            if verbose:
+                print '%d of %d pairs evaluated' % (done, len(pairs))
+    finally:
+        pool.close()
+        pool.join()
+    return sorted(scores, key=lambda a: a[0], reverse=True)
+
 def hubness(neighbors):
-    hub_scores = [0] * len(neighbors)
-    for nn in neighbors:
-        for neighbor in nn:
-            hub_scores[neighbor] += 1
-    return hub_scores
+    return KNNGraph(neighbors).hubness()
 
 def bad_neighborhoodness(neighbors, y):
-    bad_neighbor_count = [0] * len(neighbors)
-    for ego, nn in enumerate(neighbors):
-        for neighbor in nn:
-            if y[ego] != y[neighbor]:
-                bad_neighbor_count[neighbor] += 1
-    return bad_neighbor_count
+    return KNNGraph(neighbors).bad_neighborhoodness(y)
 
 def good_neighborhoodness(neighbors, y):
-    #Oh well, 2 passes...
-    return [hub - bad for hub, bad in zip(hubness(neighbors), bad_neighborhoodness(neighbors, y))]
\ No newline at end of file
+    return KNNGraph(neighbors).good_neighborhoodness(y)
\ No newline at end of file
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+import unittest
+import os.path as op
+import shutil
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+from mayolmol.mlmusings import mlio, neighbors
+
+def brute_force_nns(x, k):
+    nns = []
+    for ex in range(x.shape[0]):
+        distances = ((x - x[ex, :]) ** 2).sum(1)
+        distances[ex] = np.PINF
+        nns.append(np.argsort(distances)[0:k])
+    return np.array(nns)
+
+class NNsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.random.RandomState(0).normal(size=(300, 10))
+
+    def test_nns(self):
+        expected = brute_force_nns(self.x, 7)
+        for tile_size in (16, 100, 1024):
+            nns = neighbors.nns(self.x, 7, tile_size=tile_size, algorithm='brute')
+            self.assertEqual((300, 7), nns.shape)
+            self.assertEqual(np.int32, nns.dtype)
+            np.testing.assert_array_equal(expected, nns)
+
+    def test_nns_distances(self):
+        for algorithm in ('brute', 'kdtree'):
+            nns, distances = neighbors.nns(self.x, 3, tile_size=50, return_distances=True, algorithm=algorithm)
+            expected = np.sqrt(((self.x[:, np.newaxis, :] - self.x[nns]) ** 2).sum(-1))
+            np.testing.assert_array_almost_equal(expected, distances)
+            self.assertTrue((np.diff(distances, axis=1) >= 0).all())
+
+    def test_nns_out_of_core(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            src = op.join(tmp, 'x.npy')
+            np.save(src, self.x)
+            dest, distances_dest = op.join(tmp, 'nns.npy'), op.join(tmp, 'distances.npy')
+            nns, distances = neighbors.nns_out_of_core(src, dest, distances_dest, k=4, query_size=70, tile_size=30)
+            expected, expected_distances = neighbors.nns(self.x, 4, return_distances=True, algorithm='brute')
+            np.testing.assert_array_equal(expected, np.load(dest))
+            np.testing.assert_array_almost_equal(expected_distances, np.load(distances_dest))
+            self.assertEqual(np.int32, nns.dtype)
+            #An arff without sidecar is streamed to a .npy next to dest
+            arff = op.join(tmp, 'x.arff')
+            mlio.save_arff(self.x, np.arange(300) % 2, arff, classes=[0, 1])
+            dest = op.join(tmp, 'arff-nns.npy')
+            nns = neighbors.nns_out_of_core(arff, dest, k=4, query_size=70, tile_size=30)
+            np.testing.assert_array_equal(expected, nns)
+            self.assertTrue(op.exists(op.join(tmp, 'arff-nns-features.npy')))
+            #Regression arffs (REAL class), streamed or through a sidecar of non-renamed classes
+            arff = op.join(tmp, 'real.arff')
+            mlio.save_arff(self.x, np.linspace(0, 3, 300), arff)
+            np.testing.assert_array_equal(expected, neighbors.nns_out_of_core(arff, dest, k=4, query_size=70))
+            mlio.load_arff(arff, rename_classes=False, cache=True)
+            features = op.join(tmp, 'real-nns-features.npy')
+            neighbors.nns_out_of_core(arff, op.join(tmp, 'real-nns.npy'), k=4, query_size=70)
+            self.assertFalse(op.exists(features))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_kdtree(self):
+        x = self.x[:, :2]
+        np.testing.assert_array_equal(brute_force_nns(x, 5), neighbors.nns(x, 5))
+        #With duplicates the example itself must still be excluded
+        x = np.vstack((x, x[:10]))
+        nns = neighbors.nns(x, 3, algorithm='kdtree')
+        self.assertEqual(np.int32, nns.dtype)
+        self.assertFalse((nns == np.arange(len(x))[:, np.newaxis]).any())
+        self.assertTrue(nns[300, 0] == 0 and nns[0, 0] == 300)
+
+    def test_parallel_vizrank(self):
+        x = self.x[:100, :5]
+        y = (x[:, 1] + x[:, 3] > 0).astype(np.float64)
+        expected = neighbors.vizrank(x, y, k=5)
+        ranking = neighbors.parallel_vizrank(x, y, k=5, processes=2, batch_size=3, verbose=False)
+        self.assertEqual(sorted(expected), sorted(ranking))
+        self.assertEqual([1, 3], ranking[0][1:])
+        top = neighbors.parallel_vizrank(x, y, k=5, top=3, processes=2, verbose=False)
+        self.assertEqual([score for score, _, _ in expected[:3]], [score for score, _, _ in top])
+
+class KNNGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.x = rng.normal(size=(60, 3))
+        self.y = rng.randint(0, 3, 60)
+
+    def test_statistics(self):
+        graph = neighbors.knn_graph(self.x, 4)
+        self.assertEqual((60, 4), graph.indices.shape)
+        self.assertEqual(np.float32, graph.distances.dtype)
+        hubs, bad = [0] * 60, [0] * 60
+        errors = 0
+        for ego, nn in enumerate(graph):
+            for neighbor in nn:
+                hubs[neighbor] += 1
+                if self.y[ego] != self.y[neighbor]:
+                    bad[neighbor] += 1
+            if (self.y[nn[:3]] == self.y[ego]).sum() <= 1.5:
+                errors += 1
+        self.assertEqual(hubs, list(graph.hubness()))
+        self.assertEqual(bad, list(neighbors.bad_neighborhoodness(list(graph), self.y)))
+        self.assertEqual([hub - b for hub, b in zip(hubs, bad)], list(graph.good_neighborhoodness(self.y)))
+        self.assertAlmostEqual(errors / 60.0, neighbors.nn_error(graph.indices, self.y, 3))
+
+    def test_accuracy_curve(self):
+        graph = neighbors.knn_graph(self.x, 7)
+        ks, accuracies = neighbors.nn_acc_curve(self.x, self.y, 7)
+        self.assertEqual(range(1, 8), list(ks))
+        np.testing.assert_array_almost_equal([1 - graph.error(self.y, k) for k in ks], accuracies)
+        weighted = graph.accuracy_curve(self.y, weighted=True)
+        self.assertEqual(accuracies[0], weighted[0])
+        self.assertRaises(Exception, neighbors.KNNGraph(graph.indices).accuracy_curve, self.y, True)
+
+    def test_to_csr(self):
+        graph = neighbors.knn_graph(self.x, 4)
+        csr = graph.to_csr()
+        self.assertEqual((60, 60), csr.shape)
+        self.assertEqual(240, csr.nnz)
+        np.testing.assert_array_equal(graph.distances[5], csr[5, graph.indices[5]].toarray().ravel())
+
+class TanimotoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fps = (np.random.RandomState(0).rand(200, 150) < 0.2).astype(np.float64)
+
+    def test_pack_fingerprints(self):
+        packed = neighbors.pack_fingerprints(self.fps)
+        self.assertEqual((200, 3), packed.shape)
+        self.assertEqual(np.uint64, packed.dtype)
+        np.testing.assert_array_equal(self.fps.sum(1), neighbors.popcount(packed).sum(1))
+        np.testing.assert_array_equal(packed, neighbors.pack_fingerprints(sp.csr_matrix(self.fps), chunk_size=7))
+
+    def test_tanimoto_nns(self):
+        common = np.dot(self.fps, self.fps.T)
+        counts = self.fps.sum(1)
+        similarities = common / (counts[:, np.newaxis] + counts[np.newaxis, :] - common)
+        np.fill_diagonal(similarities, -1)
+        nns, sims = neighbors.tanimoto_nns(self.fps, 4, tile_size=64, return_similarities=True)
+        self.assertEqual(np.int32, nns.dtype)
+        np.testing.assert_array_almost_equal(np.sort(similarities, axis=1)[:, ::-1][:, :4], sims)
+        np.testing.assert_array_almost_equal(similarities[np.arange(200)[:, np.newaxis], nns], sims)
+
+class LSHTest(unittest.TestCase):
+
+    def test_minhash_lsh(self):
+        rng = np.random.RandomState(0)
+        centers = rng.rand(20, 256) < 0.15
+        fps = sp.csr_matrix(centers[rng.randint(0, 20, 400)] ^ (rng.rand(400, 256) < 0.02))
+        index = neighbors.MinHashLSH(num_tables=16, rows_per_table=3)
+        np.testing.assert_array_equal(np.arange(300), index.add(fps[:300]))
+        np.testing.assert_array_equal(np.arange(300, 400), index.add(fps[300:]))
+        self.assertEqual(400, len(index))
+        nns, distances = index.query(fps[:5], 3)
+        np.testing.assert_array_equal(np.arange(5), nns[:, 0])
+        np.testing.assert_array_almost_equal(np.zeros(5), distances[:, 0])
+        report = neighbors.lsh_recall(index, fps, k=5, sample_size=50)
+        self.assertTrue(report['recall'] > 0.9)
+        self.assertTrue(report['candidates'] < 400)
+
+    def test_minhashes(self):
+        rng = np.random.RandomState(0)
+        fps = rng.rand(30, 100) < 0.1
+        fps[[4, 29]] = False
+        index = neighbors.MinHashLSH(num_tables=4, rows_per_table=2)
+        expected = np.empty((30, 8), dtype=np.int64)
+        for row, fp in enumerate(fps):
+            on = np.flatnonzero(fp)
+            for h, (a, b) in enumerate(zip(index.a, index.b)):
+                expected[row, h] = ((a * on + b) % index.PRIME).min() if len(on) else index.PRIME
+        np.testing.assert_array_equal(expected, index.minhashes(fps))
+        np.testing.assert_array_equal(expected[:4], index.minhashes(fps[:4]))
+
+    def test_random_projection_lsh(self):
+        rng = np.random.RandomState(0)
+        x = rng.normal(size=(20, 8))[rng.randint(0, 20, 500)] + rng.normal(scale=0.05, size=(500, 8))
+        index = neighbors.RandomProjectionLSH(8, num_tables=8, projections_per_table=4, bucket_width=1.0)
+        index.add(x)
+        exact, exact_distances = index.exact_query(x[:50], 6)
+        np.testing.assert_array_equal(neighbors.nns(x, 5, algorithm='brute')[:50], exact[:, 1:])
+        report = neighbors.lsh_recall(index, x, k=5, sample_size=100)
+        self.assertTrue(report['recall'] > 0.9)
+        self.assertTrue(report['candidates'] < 500)
+        #Queries far from everything may get less than k neighbors
+        nns, distances = index.query(np.full((1, 8), 1000.0), 3)
+        self.assertTrue((nns == -1).all() and np.isinf(distances).all())
+
+if __name__ == "__main__":
+    unittest.main()
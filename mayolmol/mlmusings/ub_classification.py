@@ -2,6 +2,7 @@
 import io
 from mayolmol.mlmusings import mlio
 import neighbors
+from neighbors import KNNGraph
 import os
 import sys #TODO: check PEP 366
 import time
@@ -24,21 +25,24 @@ def class_to_color(clazz):
     return COLORS[int(clazz)]
 
 def ubigraph_populate(neighbors, y, U=None):
+    """ neighbors is a KNNGraph (or anything that can be made one, like the output of nns) """
     if not U: U = ubigraph_connect()
+    graph = neighbors if isinstance(neighbors, KNNGraph) else KNNGraph(neighbors)
     nodes = []
     stylesVertices = [U.newVertexStyle(id=int(clazz) + 1, color=class_to_color(clazz), shape="sphere") for clazz in
                       sorted(set(y))]
     styleWrongEdge = U.newEdgeStyle(id=133, color="#ff0000", stroke="dashed")
-    for i in range(len(neighbors)):
+    for i in range(len(graph)):
         nodes.append(U.newVertex(i, style=stylesVertices[int(y[i])]))
-    for i in range(len(neighbors)):
-        for nn in neighbors[i]:
-            U.newEdge(nodes[i], nodes[int(nn)],
-                      style=(styleWrongEdge if y[i] != y[int(nn)] else None))
+    sources, targets = graph.edges()
+    wrong = graph.bad_edges(y).ravel()
+    for source, target, is_wrong in zip(sources, targets, wrong):
+        U.newEdge(nodes[source], nodes[target], style=(styleWrongEdge if is_wrong else None))
 
-def ubigraph_file(src, k=5):
-    _, _, _, x, y = mlio.load_arff(src)
-    ubigraph_data(x, y, k)
+def ubigraph_file(src, k=5, metric='euclidean'):
+    _, _, _, x, y = mlio.load_arff(src, cache=True)
+    ubigraph_data(x, y, k, metric)
 
-def ubigraph_data(x, y, k=5):
-    ubigraph_populate(neighbors.nns(x, k), y)
\ No newline at end of file
+def ubigraph_data(x, y, k=5, metric='euclidean'):
+    """ metric can be "euclidean" or "tanimoto" (for binary fingerprints) """
+    ubigraph_populate(neighbors.knn_graph(x, k, metric), y)
\ No newline at end of file
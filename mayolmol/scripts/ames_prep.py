@@ -5,7 +5,7 @@
 """
 import os
 import os.path as op
-import pybel
+from mayolmol.mlmusings import mlio
 from mayolmol.descriptors.jcompoundmapper import JCompoundMapperCLIDriver
 from mayolmol.scripts.dsstox_depict import depict
 from mayolmol.scripts.dsstox_prep import create_saliviewer_input, create_master_table, save_mols, rename_mols_by_index
@@ -33,7 +33,7 @@ def prepare_dataset(sdffile, dest=None, overwrite=False):
         print '%s is already there and not overwriting requested' % dest_sdf
     else:
         print 'Reading %s' % sdffile
-        mols = list(pybel.readfile('sdf', sdffile))
+        mols = list(mlio.read_sdf(sdffile))
 
         print '\tCreating dataset root: %s' % dest
         if not op.exists(dest):
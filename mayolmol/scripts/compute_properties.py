@@ -2,17 +2,17 @@
 """ Generate different descriptors for the user's dataset. Directly inspired from Santi's dsstox_properties.py script. """
 import os
 import os.path as op
-import pybel
 import numpy
 import sys
 from mayolmol.descriptors import ob as spec
 import mayolmol.descriptors.cdkdescui as cdkdescui
+from mayolmol.mlmusings import mlio
 
 def spectrophores(dataset, overwrite=True):
     """ Compute the spectrophores for a dataset """
     try:
         print '\tSpectrophores'
-        specs = spec.spectrophores(pybel.readfile('sdf', dataset))
+        specs = spec.spectrophores(mlio.read_sdf(dataset))
         dataset_root, dataset_name = op.split(dataset)
         dataset_name = op.splitext(dataset_name)[0]
         #numpy.savetxt(op.join(dataset_root, dataset_name + '-ob-spectrophores.csv'),
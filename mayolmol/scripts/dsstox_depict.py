@@ -5,8 +5,8 @@
 """
 import os
 import os.path as op
-import pybel
 import argparse
+from mayolmol.mlmusings import mlio
 from mayolmol.scripts.dsstox_prep import DEFAULT_DSSTOX_DIR
 
 def depict(dataset):
@@ -18,7 +18,7 @@ def depict(dataset):
     depictions_dir=op.join(dataset_root, 'depictions')
     if not op.exists(depictions_dir):
         os.makedirs(depictions_dir)
-    for mol in pybel.readfile('sdf', dataset):
+    for mol in mlio.read_sdf(dataset):
         print 'Depicting: %s' %mol.title
         #This fails, need to research more (probably related to the porecomputed conformation)
         #  terminate called after throwing an instance of 'std::out_of_range'
@@ -14,13 +14,13 @@ from __future__ import with_statement
 import multiprocessing
 import os.path as op
 import os
-import pybel
 import glob
 import csv
 import operator
 import urllib
 from zipfile import ZipFile
 import argparse
+from mayolmol.mlmusings import mlio
 
 DEFAULT_DSSTOX_DIR = op.join(op.expanduser('~'), 'Proyectos', 'bsc', 'data', 'filtering', 'dsstox')
 
@@ -31,13 +31,13 @@ def rename_mols_by_index(mols, prefix=''):
         mol.title = prefix + str(i).zfill(num_mols_num_chars)
 
 def save_mols(mols, dest, format='sdf'):
-    with open(dest, 'w') as dest:
+    with mlio.open_file(dest, 'w') as dest:
         for mol in mols:
             dest.write(mol.write(format))
 
 def select_columns(csv_file, columns=None):
     projection = []
-    with open(csv_file) as reader:
+    with mlio.open_file(csv_file) as reader:
         reader = csv.reader(reader)
         for values in reader:
             if not columns: projection.append(values)
@@ -46,8 +46,8 @@ def select_columns(csv_file, columns=None):
 
 def create_master_table(sdf_file, dest_file, fields=None):
     if not fields: fields = ['Tox']
-    reader = pybel.readfile('sdf', sdf_file)  #Need to tell to implement __exit__
-    with open(dest_file, 'w') as writer:
+    reader = mlio.read_sdf(sdf_file)  #Need to tell to implement __exit__
+    with mlio.open_file(dest_file, 'w') as writer:
         #Header
         writer.write(','.join(['mol_id', 'smiles'] + fields) + '\n')
         #Data
@@ -62,7 +62,7 @@ def create_master_table(sdf_file, dest_file, fields=None):
 
 def create_saliviewer_input(master_file, dest_file):
     input = select_columns(master_file, (1, 0, 2))[1:] #Remove the header
-    with open(dest_file, 'w') as output:
+    with mlio.open_file(dest_file, 'w') as output:
         output = csv.writer(output, delimiter=' ')
         for values in input:
             output.writerow(values)
@@ -84,8 +84,8 @@ def prepare_dsstox_dataset(root, name, dest=None, overwrite=False):
         return
 
     print 'Reading %s' % name
-    train_mols = list(pybel.readfile('sdf', op.join(root, name + '_training.sdf')))
-    test_mols = list(pybel.readfile('sdf', op.join(root, name + '_prediction.sdf')))
+    train_mols = list(mlio.read_sdf(op.join(root, name + '_training.sdf')))
+    test_mols = list(mlio.read_sdf(op.join(root, name + '_prediction.sdf')))
 
     print '\tCreating dataset root: %s' % dataset_root
     if not op.exists(dataset_root):
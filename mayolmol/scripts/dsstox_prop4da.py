@@ -10,7 +10,6 @@ import numpy as np
 from mayolmol.mlmusings import mlio
 from mayolmol.scripts.dsstox_prep import DEFAULT_DSSTOX_DIR
 import itertools
-import pybel
 
 def infer_classes(y, max_distinct=10):
     """ Return the present classes in y or None if this is a regression problem.
@@ -42,14 +41,10 @@ def read_y(root, dataset):
     return read_y_from_master(op.join(root, dataset, dataset + '-master.csv'))
             
 def read_y_from_initial_data(root, dataset, label):
-    mols = pybel.readfile("sdf", op.join(root, dataset))
-    y = []
-    for mol in mols:
-        y.append(mol.data[label])
-    return y
+    return [data[label] for _, data in mlio.scan_sdf(op.join(root, dataset), fields=[label])]
 
 def read_y_from_master(masterfile):
-    with open(masterfile) as master:
+    with mlio.open_file(masterfile) as master:
         master.next()
         try:
             y = [float(line.split(',')[2]) for line in master]
@@ -90,7 +85,7 @@ def rename_classes(y, directory):
     return np.array(y2), index
 
 def cdkdeskuifps2dense(cdkdescui_fpfile, sep=' ', keep_id = False):
-    with open(cdkdescui_fpfile) as src:
+    with mlio.open_file(cdkdescui_fpfile) as src:
         header = src.next()
         name = header.split()[1]
         num_bits = int(header.split()[2])
@@ -151,7 +146,7 @@ def string_class_proportions(y):
     return total, index
 
 def cdkdeskui2dense(cdkdescui_fpfile, sep='\t'):
-    with open(cdkdescui_fpfile) as src:
+    with mlio.open_file(cdkdescui_fpfile) as src:
         header = src.next().strip()
         features = header.split(sep)[1:]
         x = [map(floatOrNaN, line.strip().split(sep)[1:]) for line in src if len(line.strip())]
@@ -166,7 +161,7 @@ def prop4da(dataset):
 
     #Process CDK descriptors
     for descs in glob.glob(op.join(root, '*-cdk-*.csv')):
-        with open(descs) as reader:
+        with mlio.open_file(descs) as reader:
             header = reader.next()
             if header.startswith('Title'):
                 x, features = cdkdeskui2dense(descs)
@@ -180,7 +175,7 @@ def prop4da(dataset):
 
     #Process ob spectrophores
     specs = op.join(root, name + '-ob-spectrophores.csv')
-    with open(specs) as reader:
+    with mlio.open_file(specs) as reader:
         specs = []
         for line in reader:
             specs.append(map(lambda a: float(a.strip()), line.split(',')))
@@ -193,7 +188,7 @@ def spectrophores_to_arff(directory, master_file, spec_csv, to_predict):
     y = read_y_from_master(op.join(directory,master_file))
     classes = infer_classes(y)
     specs = op.join(directory, spec_csv)
-    f = open(specs, 'r')
+    f = mlio.open_file(specs, 'r')
     data = []
     for line in f:
         #data.append(map(lambda a: float(a.strip()), line.split(',')))
@@ -211,7 +206,7 @@ def cdk_desc_to_arff(directory, master_file, desc_csv, to_predict):
     y = read_y_from_master(op.join(directory,master_file))
     classes = infer_classes(y)
     descs = op.join(directory, desc_csv)
-    f = open(descs, 'r')
+    f = mlio.open_file(descs, 'r')
     data = []
     line1 = f.readline()
     feature_names = ["ID"] + [name for name in line1.split()[1:]]
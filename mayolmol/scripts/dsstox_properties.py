@@ -2,17 +2,17 @@
 """ Generate different properties for the DSSTox datasets """
 import os
 import os.path as op
-import pybel
 import argparse
 import numpy
 from mayolmol.descriptors import cdkdescui, ob
+from mayolmol.mlmusings import mlio
 from mayolmol.scripts.dsstox_prep import DEFAULT_DSSTOX_DIR
 
 def spectrophores(dataset):
     """ Compute the spectrophores for a dataset """
     try:
         print '\tSpectrophores'
-        specs = ob.spectrophores_old(pybel.readfile('sdf', dataset))
+        specs = ob.spectrophores_old(mlio.read_sdf(dataset))
         dataset_root, dataset_name = op.split(dataset)
         dataset_name = op.splitext(dataset_name)[0]
         numpy.savetxt(op.join(dataset_root, dataset_name + '-ob-spectrophores.csv'),
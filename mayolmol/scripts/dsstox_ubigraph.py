@@ -9,6 +9,7 @@ import gtk
 import gobject
 import numpy
 from mayolmol.mlmusings import neighbors, mlio
+from mayolmol.mlmusings.neighbors import KNNGraph
 from mayolmol.others import ubigraph, gtkpoc, othersoft
 
 def default_class_to_color(clazz):
@@ -34,8 +35,10 @@ class UbigraphHelper():
         return U
 
     def populate(self, neighbors, y, class_to_color=None, clear=True):
+        """ neighbors is a KNNGraph (or anything that can be made one, like the output of nns) """
         if clear: self.U.clear()
         U = self.U
+        graph = neighbors if isinstance(neighbors, KNNGraph) else KNNGraph(neighbors)
         nodes = []
         if not class_to_color: class_to_color = lambda clazz: str(clazz)
         stylesVertices = [U.newVertexStyle(id=int(clazz) + 1,
@@ -48,14 +51,13 @@ class UbigraphHelper():
                                                              self.server_address)
 
         styleWrongEdge = U.newEdgeStyle(id=133, color="#ff0000", stroke="dashed")
-        for nodeIndex in range(len(neighbors)):
+        for nodeIndex in range(len(graph)):
             nodes.append(U.newVertex(nodeIndex, style=stylesVertices[int(y[nodeIndex])]))
-        for nodeIndex in range(len(neighbors)):
-            for nn in neighbors[nodeIndex]:
-                U.newEdge(nodes[nodeIndex], nodes[int(nn)],
-                          style=(styleWrongEdge if y[nodeIndex] != y[int(nn)] else None))
+        sources, targets = graph.edges()
+        for source, target, wrong in zip(sources, targets, graph.bad_edges(y).ravel()):
+            U.newEdge(nodes[source], nodes[target], style=(styleWrongEdge if wrong else None))
 
-def chem_ubigraph(x, y, pics=glob.glob('/home/santi/Proyectos/bsc/data/filtering/dsstox/BCF/depictions/*.png')):
+def chem_ubigraph(x, y, pics=glob.glob('/home/santi/Proyectos/bsc/data/filtering/dsstox/BCF/depictions/*.png'), metric='euclidean'):
     iw = gtkpoc.ImageWindow(pics)
     def vertex_callback(v):
         gtk.threads_enter()
@@ -64,7 +66,7 @@ def chem_ubigraph(x, y, pics=glob.glob('/home/santi/Proyectos/bsc/data/filtering
         return 0
     port = random.randint(20739, 20999)
     U = UbigraphHelper(callback_port=port)
-    U.populate(neighbors.nns(x), y, class_to_color=default_class_to_color)
+    U.populate(neighbors.knn_graph(x, metric=metric), y, class_to_color=default_class_to_color)
     server = SimpleXMLRPCServer(("localhost", port))
     server.register_introspection_functions()
     server.register_function(vertex_callback, 'vertex_callback')
@@ -83,15 +85,15 @@ def random_problem(num_points=800, dimensionality=30):
 def dsstox_problem(name='Mutagenicity'):
     root = op.join(op.expanduser('~'), 'Proyectos', 'bsc', 'data', 'filtering', 'dsstox', name)
     x = numpy.loadtxt(op.join(root, name +'-ob-spectrophores.csv'), delimiter=',')
-    with open(op.join(root, name +'-master.csv')) as master:
+    with mlio.open_file(op.join(root, name +'-master.csv')) as master:
         master.next()
         y = [1 if float(line.split(',')[2]) > 1 else 0 for line in master]
         y = numpy.array(y)
     pics = glob.glob(op.join(root, 'depictions', '*.png'))
     return x, y, pics
 
-def generic_problem(arfffile=op.join(op.expanduser('~'), 'Proyectos', 'bsc', 'data', 'filtering', 'mutagenicity', 'all', 'mutagenicity-all-cas-union-prepared-jcm-ECFP-dense.arff')):
-    _, _, _, x, y = mlio.load_arff(arfffile)
+def generic_problem(arfffile=op.join(op.expanduser('~'), 'Proyectos', 'bsc', 'data', 'filtering', 'mutagenicity', 'all', 'mutagenicity-all-cas-union-prepared-jcm-ECFP.arff')):
+    _, _, _, x, y = mlio.load_sparse_arff(arfffile, cache=True)
     root, _ = op.split(arfffile)
     pics = glob.glob(op.join(root, 'depictions', '*.png'))
     return x, y, pics
@@ -101,4 +103,4 @@ def linear_gradient(num_colors, num_color, start=0, end=255):
 
 #x, y, pics = dsstox_problem()
 x, y, pics = generic_problem()
-chem_ubigraph(x, y, pics)
\ No newline at end of file
+chem_ubigraph(x, y, pics, metric='tanimoto')
\ No newline at end of file
@@ -7,10 +7,12 @@ import mayolmol.scripts.compute_properties as prop
 import mayolmol.descriptors.cdkdescui as cdkdescui
 import mayolmol.scripts.dsstox_prop4da as arff
 import mayolmol.mlmusings.mlio as mlio
+import mayolmol.mlmusings.dr as dr
+import numpy
 
 if __name__ == "__main__":
     
-    if len(sys.argv) == 3:
+    if len(sys.argv) in (3, 4):
         dataset = sys.argv[1]
         if op.exists(dataset):
             directory = op.dirname(dataset)
@@ -41,19 +43,25 @@ if __name__ == "__main__":
             for file in fingerprint_files:
                 print "Converting to .arff format the fingerprint file %s."%file[1]
                 arff.cdk_fpt_to_arff(directory, op.basename(master_file), op.basename(file[1]), label, file[0])
-            dest_arff1 = op.splitext(prepared_data)[0] + '_cdk_spectrophores_tmp.arff'
-            dest_arff2 = op.splitext(prepared_data)[0] + '_maccs_estate_tmp.arff'
-            dest_arff3 = op.splitext(prepared_data)[0] + '_cdk_spec_maccs_estate_tmp.arff'
-            dest_arff_master = op.splitext(prepared_data)[0] + "_all_descriptors.arff"
+            base = op.splitext(prepared_data)[0]
+            dest_arff_master = base + "_all_descriptors.arff"
             print "Merging .arff files into a master one."
-            mlio.merge_arff2(directory, dest_arff1, op.splitext(prepared_data)[0] + "-cdk.arff", op.splitext(prepared_data)[0] + "-ob-spectrophores.arff", False)
-            mlio.merge_arff2(directory, dest_arff2, op.splitext(prepared_data)[0] + "-cdk-maccs.arff", op.splitext(prepared_data)[0] + "-cdk-estate.arff", False)
-            mlio.merge_arff2(directory, dest_arff3, dest_arff1, dest_arff2, False)
-            mlio.merge_arff2(directory, dest_arff_master, dest_arff3, op.splitext(prepared_data)[0] + "-cdk-extended.arff", False)
+            mlio.merge_arffs(dest_arff_master, [base + "-cdk.arff",
+                                                base + "-ob-spectrophores.arff",
+                                                base + "-cdk-maccs.arff",
+                                                base + "-cdk-estate.arff",
+                                                base + "-cdk-extended.arff"])
+            if len(sys.argv) == 4:
+                #Score the new dataset against an existing embedding (a saved dr.PCA / dr.KernelPCA)
+                model = dr.load_model(sys.argv[3])
+                _, _, _, x, _ = mlio.load_arff(dest_arff_master, rename_classes=False)
+                print "Projecting into the embedding %s." % sys.argv[3]
+                #The first attribute is the compound ID, not a descriptor
+                numpy.savetxt(base + "_embedding.csv", model.transform(x[:, 1:]), delimiter=',')
         else:
             print "There is no such file %s."%dataset
             sys.exit()
     else:
-        print "Too many or too little arguments. Please remember:\n - the first argument is the absolute path to the dataset file\n - the second argument is the name of the property you want to predict, as written in the corresponding .sdf section"
+        print "Too many or too little arguments. Please remember:\n - the first argument is the absolute path to the dataset file\n - the second argument is the name of the property you want to predict, as written in the corresponding .sdf section\n - the optional third argument is a saved embedding model (see mlmusings.dr) to project the dataset into"
         sys.exit()
         
@@ -2,9 +2,8 @@
 """ Preparation for the mutagenicity datasets """
 import os
 import os.path as op
-import pybel
+from mayolmol.mlmusings import mlio
 from mayolmol.descriptors.jcompoundmapper import JCompoundMapperCLIDriver
-from mayolmol.others.wekacli import WekaCLIDriver
 from mayolmol.scripts.dsstox_depict import depict
 from mayolmol.scripts.dsstox_prep import create_saliviewer_input, create_master_table, save_mols, rename_mols_by_index
 from mayolmol.scripts.dsstox_prop4da import prop4da
@@ -14,12 +13,12 @@ def aid2sdf(sdf, csv, dest=None):
     """ Reads a pubchem bioassay results and merge it with the SDF file """
     #Read the known activities to a dictionary        
     activities = {}
-    for activity in open(csv).readlines()[1:]:
+    for activity in mlio.open_file(csv).readlines()[1:]:
         value = activity.split(',')[5]
         molid = activity.split(',')[2]
         activities[molid] = value
         #Save the activity to each molecule
-    mols = list(pybel.readfile('sdf', sdf))
+    mols = list(mlio.read_sdf(sdf))
     for mol in mols:
         activity = activities[mol.title]
         if activity == 'Active': actual_activity = '1'
@@ -73,7 +72,7 @@ def prepare_dataset(sdffile, dest=None, rename=True, conformations=False, overwr
         print '%s is already there and not overwriting requested' % dest_sdf
     else:
         print 'Reading %s' % sdffile
-        mols = list(pybel.readfile('sdf', sdffile))
+        mols = list(mlio.read_sdf(sdffile))
 
         print '\tCreating dataset root: %s' % dest
         if not op.exists(dest):
@@ -104,15 +103,17 @@ def prepare_dataset(sdffile, dest=None, rename=True, conformations=False, overwr
 
     return dest_sdf, master_table
 
-def jcm_fingerprint(sdf, fingerprints, label='Activity', hash_space_size=2**10, as_dense_too=True):
+def jcm_fingerprint(sdf, fingerprints, label='Activity', hash_space_size=2**10, output_format='WEKA_HASHED'):
+    """ The (sparse) arffs are read directly by mlio.load_sparse_arff, no need to densify them.
+        LIBSVM_SPARSE is more compact, read it with mlio.load_libsvm.
+    """
     #TODO: use multiprocessing
     for fp in fingerprints:
         print '\t' + fp
-        output = op.splitext(sdf)[0] + '-jcm-' + fp + '.arff'
+        output = op.splitext(sdf)[0] + '-jcm-' + fp + JCompoundMapperCLIDriver.OUTPUT_EXTENSIONS[output_format]
         JCompoundMapperCLIDriver().fingerprint(sdf, output, fingerprint=fp, label=label,
+                                               output_format=output_format,
                                                hash_space_size=hash_space_size)
-        if as_dense_too:
-            WekaCLIDriver().sparse2dense(output)
 
 if __name__ == '__main__':
     root = op.join(op.expanduser('~'), 'Proyectos', 'bsc', 'data', 'filtering', 'mutagenicity', 'all')
@@ -124,9 +125,9 @@ if __name__ == '__main__':
     dsstox_original = op.join(root, 'dsstox.sdf')
 
     print '\tReading the sdf files'
-    mols_ames = list(pybel.readfile('sdf', ames_original))
-    mols_bursi = list(pybel.readfile('sdf', bursi_original))
-    mols_dsstox = list(pybel.readfile('sdf', dsstox_original))
+    mols_ames = list(mlio.read_sdf(ames_original))
+    mols_bursi = list(mlio.read_sdf(bursi_original))
+    mols_dsstox = list(mlio.read_sdf(dsstox_original))
 
     print 'Num molecules ames=%d, bursi=%d, dsstox=%d' % (len(mols_ames), len(mols_bursi), len(mols_dsstox))
 
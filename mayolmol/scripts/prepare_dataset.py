@@ -3,13 +3,13 @@
 from __future__ import with_statement
 import os.path as op
 import os
-import pybel
 import glob
 import csv
 import operator
 import sys
 import mayolmol.scripts.dsstox_depict as pics
 import mayolmol.scripts.dsstox_prop4da as prop4da
+from mayolmol.mlmusings import mlio
 
 def rename_mols_by_index(mols, prefix=''):
     num_mols_num_chars = len(str(len(mols)))
@@ -18,13 +18,13 @@ def rename_mols_by_index(mols, prefix=''):
         mol.title = prefix + str(i).zfill(num_mols_num_chars)
 
 def save_mols(mols, dest, format='sdf'):
-    with open(dest, 'w') as dest:
+    with mlio.open_file(dest, 'w') as dest:
         for mol in mols:
             dest.write(mol.write(format))
 
 def select_columns(csv_file, columns=None):
     projection = []
-    with open(csv_file) as reader:
+    with mlio.open_file(csv_file) as reader:
         reader = csv.reader(reader)
         for values in reader:
             if not columns: projection.append(values)
@@ -33,8 +33,8 @@ def select_columns(csv_file, columns=None):
 
 def create_master_table(sdf_file, dest_file, fields=None, rename_classes=False, index=None):
     if not fields: fields = ['Tox']
-    reader = pybel.readfile('sdf', sdf_file)  #Need to tell to implement __exit__
-    with open(dest_file, 'w') as writer:
+    reader = mlio.read_sdf(sdf_file)  #Need to tell to implement __exit__
+    with mlio.open_file(dest_file, 'w') as writer:
         #Header
         writer.write(','.join(['mol_id', 'smiles'] + fields) + '\n')
         #Data
@@ -58,7 +58,7 @@ def create_master_table(sdf_file, dest_file, fields=None, rename_classes=False,
 
 def create_saliviewer_input(master_file, dest_file):
     input = select_columns(master_file, (1, 0, 2))[1:] #Remove the header
-    with open(dest_file, 'w') as output:
+    with mlio.open_file(dest_file, 'w') as output:
         output = csv.writer(output, delimiter=' ')
         for values in input:
             output.writerow(values)
@@ -66,15 +66,14 @@ def create_saliviewer_input(master_file, dest_file):
 def desalt(dataset, output):
     """Reading and if necessary remove salts in dataset and write a
     new output .sdf with pybel module StripSalts() from OBMol class""" 
-    mols = pybel.readfile("sdf", dataset)
-    outputf = pybel.Outputfile("sdf", output, overwrite=True)
-    for mol in mols:
-        if mol.OBMol.StripSalts():
-            #print "removing salts."
-            outputf.write(mol)
-        else:
-            outputf.write(mol)
-    outputf.close()
+    mols = mlio.read_sdf(dataset)
+    with mlio.open_file(output, 'w') as outputf:
+        for mol in mols:
+            if mol.OBMol.StripSalts():
+                #print "removing salts."
+                outputf.write(mol.write("sdf"))
+            else:
+                outputf.write(mol.write("sdf"))
     return output
     
 def keep_unique(mols):
@@ -120,7 +119,7 @@ def prepare_user_dataset(root, dataset_name, field, dest=None, overwrite=False):
     print "Desalting molecules..."
     dataset = desalt(dataset, op.splitext(dataset)[0] + "_desalted.sdf")
     print 'Reading dataset into pybel molecules...'
-    mols = list(pybel.readfile('sdf', dataset))
+    mols = list(mlio.read_sdf(dataset))
     init_number = len(mols)
     print "Your initial dataset contain %i molecules."%init_number
     print 'Removing duplicated molecules...'